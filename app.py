@@ -1,23 +1,303 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+import os
+import importlib
+import importlib.util
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, send_file, \
+    jsonify, Response, make_response, stream_with_context, g, has_request_context, before_render_template, \
+    template_rendered
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timedelta
-import pandas as pd
-from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from flask_sqlalchemy.session import Session as FlaskSession
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import and_, or_, select, func, insert, event, bindparam, inspect as sa_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import load_only, Session
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO, RawIOBase
+from itertools import chain
+from functools import cache
+import tempfile
 import base64
+import threading
+import time
+import queue
+import atexit
+import gc
+import sqlite3
+import hashlib
+import shutil
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextvars import ContextVar
+from contextlib import contextmanager
+from collections import OrderedDict, namedtuple
+import click
+import csv
+import json
+import re
+from urllib.parse import quote
+from werkzeug.utils import secure_filename
 from flask_wtf.csrf import CSRFProtect
 from dotenv import load_dotenv
 load_dotenv()
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'substation.db'))
-db = SQLAlchemy(app)
-csrf = CSRFProtect(app)
+class LazyModule:
+    # Imports the module on first attribute access, so a worker that only
+    # serves the index page never loads it. Ingest does load pandas and numpy:
+    # the derived quantities, rollups and anomaly state of every batch are
+    # computed with them, so a cold worker's first ingest pays for the import
+    # (preloaded gunicorn workers inherit it from warm_up). The regular import
+    # statement does the loading, and its per-module lock makes threads that
+    # race to the first use (query_shards fans out before anything else
+    # touches pandas) wait for the fully initialised module.
+    # importlib.util.LazyLoader has no such lock and hands the other threads a
+    # half-executed module. matplotlib and xlsxwriter are imported inside the
+    # few functions that use them.
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self._name), attribute)
+
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+
+def get_engine_options(url):
+    if url.startswith('sqlite'):
+        # Wait for the write lock instead of failing with "database is locked"
+        return {'connect_args': {'timeout': 30}}
+    return {'connect_args': {}, 'pool_size': 10, 'max_overflow': 20, 'pool_pre_ping': True, 'pool_recycle': 1800}
+
+current_shard = ContextVar('current_shard', default=None)
+
+class ShardSession(FlaskSession):
+    # Statements run inside use_shard() go to that shard's database
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = current_shard.get()
+        if bind is None and shard is not None:
+            return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': ShardSession})
+migrate = Migrate(render_as_batch=True)
+csrf = CSRFProtect()
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'substation.db'))
+    # Substations can live in their own databases. DATABASE_SHARDS names them
+    # ("east=sqlite:////data/east.db west=postgresql://..."), SHARD_MAP assigns
+    # substations to them ("Adama=east,Hawassa=east"); unassigned substations stay
+    # in DATABASE_URL together with the threshold limits.
+    app.config['SQLALCHEMY_BINDS'] = {name: {'url': url, **get_engine_options(url)} for name, url in
+                                      (item.split('=', 1) for item in os.environ.get('DATABASE_SHARDS', '').split())}
+    app.config['SHARD_MAP'] = dict(item.strip().split('=', 1) for item in os.environ.get('SHARD_MAP', '').split(',')
+                                   if item.strip())
+    # Requests slower than this many seconds are logged with their SQL; unset disables the log
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ['SLOW_REQUEST_SECONDS']) \
+        if os.environ.get('SLOW_REQUEST_SECONDS') else None
+    # Queue submitted readings and commit them in batches from a background thread
+    app.config['INGEST_WRITE_BEHIND'] = os.environ.get('INGEST_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    # Open /stream responses per process; each holds a worker thread (see gunicorn.conf.py)
+    app.config['STREAM_MAX_CLIENTS'] = int(os.environ.get('STREAM_MAX_CLIENTS', 8))
+    # Run report forms and filtered exports as background jobs in a process pool
+    app.config['REPORT_JOBS'] = os.environ.get('REPORT_JOBS', '').lower() in ('1', 'true', 'yes')
+    app.config['REPORT_JOB_WORKERS'] = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+    app.config['REPORT_JOB_DIR'] = os.environ.get('REPORT_JOB_DIR', os.path.join(app.instance_path, 'report_jobs'))
+    # Report results are cached per process ('memory'), in a directory shared by every worker ('disk') or not at all ('none').
+    # Report jobs hand their results to the web workers through the cache, so they need the disk cache.
+    app.config['REPORT_CACHE'] = os.environ.get('REPORT_CACHE', 'disk' if app.config['REPORT_JOBS'] else 'memory')
+    app.config['REPORT_CACHE_DIR'] = os.environ.get('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+    app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 64 * 2 ** 20))
+    # Readings older than ARCHIVE_AFTER_DAYS are moved here by "flask archive-measurements"
+    app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+    # Monthly PDF/DOCX reports per substation written by "flask generate-reports"
+    app.config['BATCH_REPORT_DIR'] = os.environ.get('BATCH_REPORT_DIR', os.path.join(app.instance_path, 'batch_reports'))
+    app.config['BATCH_REPORT_WORKERS'] = int(os.environ.get('BATCH_REPORT_WORKERS', os.cpu_count() or 1))
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', get_engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    for substation, shard in app.config['SHARD_MAP'].items():
+        if shard not in app.config['SQLALCHEMY_BINDS']:
+            raise ValueError(f"SHARD_MAP assigns {substation} to unknown shard {shard}")
+    if app.config['REPORT_JOBS'] and app.config['REPORT_CACHE'] != 'disk':
+        raise ValueError("REPORT_JOBS needs REPORT_CACHE=disk, where the web workers find the jobs' results")
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+    csrf.init_app(app)
+    app.register_blueprint(bp)
+    app.extensions['report_cache'] = create_report_cache(app.config)
+    return app
+
+def warm_up(app):
+    # For "gunicorn --preload": load everything a worker would load lazily in
+    # the master, so the forked workers share those pages copy-on-write instead
+    # of each importing its own copy. Connections are closed before the fork
+    # and the survivors are frozen out of the cyclic GC, whose collections
+    # would otherwise write to (and so copy) every object they visit.
+    # Touching an attribute runs the lazily imported modules
+    pd.DataFrame, np.ndarray
+    get_matplotlib()
+    for name in ['matplotlib.figure', 'matplotlib.backends.backend_agg', 'xlsxwriter']:
+        importlib.import_module(name)
+    for template in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+@cache
+def get_matplotlib():
+    # Figures are built through the object-oriented API, so the style is
+    # applied once on first import rather than through per-request pyplot state
+    import matplotlib
+    import matplotlib.style
+    matplotlib.style.use('ggplot')
+    return matplotlib
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    # WAL lets report reads run alongside the single writer instead of blocking behind it
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+RECORDS_PAGE_SIZE = 50
+AGGREGATE_COLUMNS = ['substation', 'bay', 'key', 'count', 'min', 'max', 'mean', 'm2']
+PHASE_CURRENTS = ['IA', 'IB', 'IC', 'IN']
+PHASE_VOLTAGES = ['VA', 'VB', 'VC', 'VN']
+SEQUENCE_COMPONENTS = ['I0', 'I1', 'I2', 'V0', 'V1', 'V2']
+LINE_PARAMETERS = PHASE_CURRENTS + PHASE_VOLTAGES + SEQUENCE_COMPONENTS
+LINE_VALUE_COLUMNS = {parameter: ('seq_' if parameter in SEQUENCE_COMPONENTS else 'phase_') + parameter.lower()
+                      for parameter in LINE_PARAMETERS}
+PARAMETER_KINDS = dict([(parameter, 'current') for parameter in PHASE_CURRENTS] +
+                       [(parameter, 'voltage') for parameter in PHASE_VOLTAGES] +
+                       [(parameter, 'sequence') for parameter in SEQUENCE_COMPONENTS])
+PHASE_ANGLE_FIELDS = [f'{phase}_angle' for phase in ['IA', 'IB', 'IC', 'VA', 'VB', 'VC']]
+DERIVED_LINE_FIELDS = ['apparent_power', 'power_factor', 'current_unbalance', 'voltage_unbalance', 'loading']
+DERIVED_WINDING_FIELDS = [f'{winding}_{quantity}' for winding in ['hv', 'mv', 'lv']
+                          for quantity in ['apparent_power', 'power_factor', 'current_unbalance', 'loading']]
+DERIVED_FIELDS = DERIVED_LINE_FIELDS + DERIVED_WINDING_FIELDS
+TRANSFORMER_LIMIT_FIELDS = ['oil_temp', 'hv_winding_temp', 'mv_winding_temp', 'lv_winding_temp', 'tap_position']
+RECORD_LIMIT_FIELDS = TRANSFORMER_LIMIT_FIELDS + DERIVED_FIELDS
+THRESHOLD_PARAMETERS = ['current', 'voltage'] + SEQUENCE_COMPONENTS + RECORD_LIMIT_FIELDS
+DEFAULT_THRESHOLDS = {'current': 1600, 'voltage': 500, 'I0': 50, 'V0': 50}
+THRESHOLD_PAGE_SIZE = 100
+# Anomaly detection compares a fast EWMA (about a day of 15 minute readings)
+# and each reading's rate of change against a slow EWMA baseline (about a
+# month), once a location has about a week of history
+ANOMALY_FAST_SPAN = 96
+ANOMALY_SLOW_SPAN = 2880
+ANOMALY_MIN_READINGS = 672
+# Scores are in standard deviations; rates and temperatures have heavier tails
+ANOMALY_DRIFT_LIMIT = 3.0
+ANOMALY_Z_LIMIT = 5.0
+# Temperatures are also checked against the loading of the winding that heats them
+ANOMALY_LOAD_FIELDS = {'oil_temp': 'hv_loading', 'hv_winding_temp': 'hv_loading',
+                       'mv_winding_temp': 'mv_loading', 'lv_winding_temp': 'lv_loading'}
+ANOMALY_PARAMETERS = LINE_PARAMETERS + list(ANOMALY_LOAD_FIELDS)
+ANOMALY_STATE_COLUMNS = ['reading_count', 'last_timestamp', 'last_value', 'fast_mean', 'value_mean', 'value_mean_sq',
+                         'noise_mean_sq', 'rate_mean', 'rate_mean_sq', 'load_mean', 'load_mean_sq', 'cross_mean']
+# IEC 60076-7 thermal model for medium and large power transformers (ONAN/ONAF):
+# hot-spot factor H, winding-to-oil gradient gr (K) at rated load and winding
+# exponent y. The aging rate of non-thermally upgraded paper doubles every
+# 6 K above a 98 C hot spot, against a normal insulation life of 180000 hours.
+TRANSFORMER_HOT_SPOT_FACTOR = 1.3
+TRANSFORMER_WINDING_GRADIENT = 26.0
+TRANSFORMER_WINDING_EXPONENT = 1.3
+TRANSFORMER_REFERENCE_HOT_SPOT = 98.0
+TRANSFORMER_AGING_DOUBLING = 6.0
+TRANSFORMER_NORMAL_LIFE_HOURS = 180000
+# Readings further apart than this start a new run; the gap is not aged
+TRANSFORMER_MAX_INTERVAL = timedelta(hours=1)
+TRANSFORMER_LOADING_FIELDS = ['hv_loading', 'mv_loading', 'lv_loading']
+# Ingest batches with more transformers refresh the whole date range, which then costs about the same
+TRANSFORMER_REFRESH_MAX_LOCATIONS = 200
+TRANSFORMER_DAY_COLUMNS = ['reading_count', 'covered_hours', 'max_loading', 'max_oil_temp', 'max_hot_spot',
+                           'aging_hours', 'tap_operations']
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_METADATA_COLUMNS = ['record_id', 'timestamp', 'substation', 'bay', 'voltage_level',
+                           'element_type', 'winding_type', 'relay_type']
+EXPORT_COLUMNS = EXPORT_METADATA_COLUMNS + ['parameter', 'value']
+MEASURED_RECORD_FIELDS = ['tap_position', 'oil_temp', 'hv_winding_temp', 'mv_winding_temp', 'lv_winding_temp',
+                          'hv_ia', 'hv_ib', 'hv_ic', 'mv_ia', 'mv_ib', 'mv_ic', 'lv_ia', 'lv_ib', 'lv_ic',
+                          'hv_active_power', 'hv_reactive_power', 'mv_active_power', 'mv_reactive_power',
+                          'lv_active_power', 'lv_reactive_power', 'active_power', 'reactive_power']
+RECORD_VALUE_FIELDS = MEASURED_RECORD_FIELDS + DERIVED_FIELDS
+# Derived quantities are read from the records and not rolled up
+ROLLUP_PARAMETERS = MEASURED_RECORD_FIELDS + LINE_PARAMETERS
+EXPORT_RECORD_FIELDS = RECORD_VALUE_FIELDS + ['hv_ct_ratio', 'mv_ct_ratio', 'lv_ct_ratio', 'ct_ratio']
+EXCEL_MAX_ROWS = 1048576
+ARCHIVE_ROW_GROUP_SIZE = 10000
+ARCHIVE_DELETE_BATCH_SIZE = 500
+INGEST_BATCH_SIZE = 1000
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_FLUSH_SECONDS = 1.0
+WRITE_BEHIND_MAX_PENDING = 10000
+WRITE_BEHIND_RETRIES = 5
+STREAM_CLIENT_BUFFER = 100
+STREAM_HEARTBEAT_SECONDS = 15
+# How long a page turned away by a full /stream waits before it tries again
+STREAM_RETRY_SECONDS = 60
+REPORT_JOB_MAX_PENDING = 20
+REPORT_TEMPLATES = {'summary': 'summary_report.html', 'thresholds': 'threshold_report.html',
+                    'trends': 'trend_analysis.html', 'transformers': 'transformer_report.html'}
+# Queued or running jobs not updated for this long are treated as lost and may be resubmitted
+REPORT_JOB_TIMEOUT = 1800
+REPORT_JOB_RETENTION = 86400
+# Settings a spawned job or batch report worker takes from the app that started it
+JOB_CONFIG_KEYS = ['SECRET_KEY', 'SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_BINDS', 'SQLALCHEMY_ENGINE_OPTIONS', 'SHARD_MAP',
+                   'REPORT_CACHE', 'REPORT_CACHE_DIR', 'REPORT_CACHE_MAX_BYTES', 'REPORT_JOB_DIR', 'ARCHIVE_DIR',
+                   'BATCH_REPORT_DIR']
+BATCH_REPORT_FORMATS = ['pdf', 'docx']
+BATCH_REPORT_SECTIONS = [('Phase Currents', PHASE_CURRENTS), ('Phase Voltages', PHASE_VOLTAGES),
+                         ('Sequence Components', SEQUENCE_COMPONENTS)]
+# Longer alert lists are cut off in the documents; the threshold report has them all
+BATCH_REPORT_MAX_ALERTS = 200
+TREND_MAX_POINTS = 2000
+TREND_MARKER_LIMIT = 100
+# No bucket finer than an hour: at the 15 minute sampling interval it would copy the raw rows
+ROLLUP_GRANULARITIES = {'hour': 'h', 'day': 'D', 'month': 'MS', 'all': None}
+# bucket_start of the single all-time bucket per location and parameter
+ROLLUP_ALL_TIME_START = datetime(1970, 1, 1)
+# Longest span (in days) plotted from raw rows / from each rollup granularity
+TREND_SPAN_LIMITS = [(7, None), (730, 'hour')]
+DIMENSION_CACHE_TTL = 300
+PLAN_CHECK_TABLES = ['measurement_record', 'measurement_rollup', 'data_version', 'transformer_day']
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SLOW_REQUEST_QUERY_LIMIT = 10
+# Nominal line-to-line kV of the transmission and distribution levels used by generate-fleet
+FLEET_VOLTAGE_LEVELS = {'400kV': 400, '230kV': 230, '132kV': 132, '66kV': 66}
+FLEET_DISTRIBUTION_LEVELS = {'33kV': 33, '15kV': 15}
+dimension_cache = {'loaded_at': None, 'substations': {}, 'bays': {}}
+dimension_cache_lock = threading.Lock()
+report_job_futures = {}
+# The submitting app's settings, in a job or batch report worker
+job_config = None
+report_job_lock = threading.Lock()
+# Per-process request metrics served by /metrics with a pid label, keyed by (method, route)
+request_metrics = {}
+request_metrics_lock = threading.Lock()
 
 # Database Models
+class Substation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+class Bay(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    substation_id = db.Column(db.Integer, db.ForeignKey('substation.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('substation_id', 'name', name='uq_bay_substation_name'),)
+
 class MeasurementRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -25,6 +305,9 @@ class MeasurementRecord(db.Model):
     winding_type = db.Column(db.String(20))
     substation_name = db.Column(db.String(100), nullable=False)
     bay_name = db.Column(db.String(100), nullable=False)
+    substation_id = db.Column(db.Integer, db.ForeignKey(
+        'substation.id', name='fk_measurement_record_substation_id_substation'))
+    bay_id = db.Column(db.Integer, db.ForeignKey('bay.id', name='fk_measurement_record_bay_id_bay'))
     voltage_level = db.Column(db.String(50), nullable=False)
     relay_type = db.Column(db.String(100), nullable=False)
     
@@ -58,241 +341,1091 @@ class MeasurementRecord(db.Model):
     reactive_power = db.Column(db.Float)
     ct_ratio = db.Column(db.String(50))
 
-    # Line Specific Relationships
-    phase_currents = db.relationship('PhaseCurrent', backref='record', cascade='all, delete-orphan')
-    phase_voltages = db.relationship('PhaseVoltage', backref='record', cascade='all, delete-orphan')
-    sequence_components = db.relationship('SequenceComponent', backref='record', cascade='all, delete-orphan')
-
-class PhaseCurrent(db.Model):
+    # Line Phase Values
+    phase_ia = db.Column(db.Float)
+    phase_ib = db.Column(db.Float)
+    phase_ic = db.Column(db.Float)
+    phase_in = db.Column(db.Float)
+    phase_va = db.Column(db.Float)
+    phase_vb = db.Column(db.Float)
+    phase_vc = db.Column(db.Float)
+    phase_vn = db.Column(db.Float)
+
+    # Line Sequence Components
+    seq_i0 = db.Column(db.Float)
+    seq_i1 = db.Column(db.Float)
+    seq_i2 = db.Column(db.Float)
+    seq_v0 = db.Column(db.Float)
+    seq_v1 = db.Column(db.Float)
+    seq_v2 = db.Column(db.Float)
+
+    # Derived Quantities, filled in by derive_quantities on ingest
+    apparent_power = db.Column(db.Float)
+    power_factor = db.Column(db.Float)
+    current_unbalance = db.Column(db.Float)
+    voltage_unbalance = db.Column(db.Float)
+    loading = db.Column(db.Float)
+    hv_apparent_power = db.Column(db.Float)
+    hv_power_factor = db.Column(db.Float)
+    hv_current_unbalance = db.Column(db.Float)
+    hv_loading = db.Column(db.Float)
+    mv_apparent_power = db.Column(db.Float)
+    mv_power_factor = db.Column(db.Float)
+    mv_current_unbalance = db.Column(db.Float)
+    mv_loading = db.Column(db.Float)
+    lv_apparent_power = db.Column(db.Float)
+    lv_power_factor = db.Column(db.Float)
+    lv_current_unbalance = db.Column(db.Float)
+    lv_loading = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('ix_measurement_record_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_measurement_record_location_time', 'substation_name', 'bay_name', 'timestamp'),
+        db.Index('ix_measurement_record_bay_time', 'bay_name', 'timestamp'),
+    )
+
+    # Read-only views in the shape of the former child-table relationships
+    @property
+    def phase_currents(self):
+        return self.line_values(PHASE_CURRENTS, PhaseValue)
+
+    @property
+    def phase_voltages(self):
+        return self.line_values(PHASE_VOLTAGES, PhaseValue)
+
+    @property
+    def sequence_components(self):
+        return self.line_values(SEQUENCE_COMPONENTS, SequenceValue)
+
+    def line_values(self, parameters, value_type):
+        values = [(parameter, getattr(self, LINE_VALUE_COLUMNS[parameter])) for parameter in parameters]
+        return [value_type(parameter, value) for parameter, value in values if value is not None]
+
+PhaseValue = namedtuple('PhaseValue', ['phase', 'value'])
+SequenceValue = namedtuple('SequenceValue', ['component', 'value'])
+
+class ThresholdLimit(db.Model):
+    # Scope columns left empty match every value; the most specific match wins
+    # (bay, then voltage level, then substation).
     id = db.Column(db.Integer, primary_key=True)
-    record_id = db.Column(db.Integer, db.ForeignKey('measurement_record.id'), nullable=False)
-    phase = db.Column(db.String(2), nullable=False)
-    value = db.Column(db.Float, nullable=False)
-
-class PhaseVoltage(db.Model):
+    parameter = db.Column(db.String(30), nullable=False)
+    substation_name = db.Column(db.String(100))
+    voltage_level = db.Column(db.String(50))
+    bay_name = db.Column(db.String(100))
+    low_limit = db.Column(db.Float)
+    high_limit = db.Column(db.Float)
+
+class MeasurementRollup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    record_id = db.Column(db.Integer, db.ForeignKey('measurement_record.id'), nullable=False)
-    phase = db.Column(db.String(2), nullable=False)
-    value = db.Column(db.Float, nullable=False)
-
-class SequenceComponent(db.Model):
+    granularity = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    substation_name = db.Column(db.String(100), nullable=False)
+    bay_name = db.Column(db.String(100), nullable=False)
+    parameter = db.Column(db.String(30), nullable=False)
+    value_count = db.Column(db.Integer, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    # Welford accumulators: running mean and sum of squared deviations (M2)
+    value_mean = db.Column(db.Float, nullable=False)
+    value_m2 = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', 'substation_name', 'bay_name', 'parameter',
+                            name='uq_measurement_rollup_bucket'),
+        db.Index('ix_measurement_rollup_location', 'granularity', 'substation_name', 'bay_name', 'bucket_start'),
+    )
+
+class DataVersion(db.Model):
+    # Bumped in the same transaction as every write to a location's day, so a
+    # report's cache key changes whenever data inside its filters does.
     id = db.Column(db.Integer, primary_key=True)
-    record_id = db.Column(db.Integer, db.ForeignKey('measurement_record.id'), nullable=False)
-    component = db.Column(db.String(2), nullable=False)
-    value = db.Column(db.Float, nullable=False)
+    substation_name = db.Column(db.String(100), nullable=False)
+    bay_name = db.Column(db.String(100), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
 
-@app.route('/', methods=['GET', 'POST'])
+    __table_args__ = (
+        db.UniqueConstraint('substation_name', 'bay_name', 'bucket_start', name='uq_data_version_day'),
+        db.Index('ix_data_version_bay', 'bay_name', 'bucket_start'),
+    )
+
+class AnomalyState(db.Model):
+    # Exponentially weighted averages at the last reading of a location and
+    # parameter, so each ingest batch only scores its own readings.
+    id = db.Column(db.Integer, primary_key=True)
+    substation_name = db.Column(db.String(100), nullable=False)
+    bay_name = db.Column(db.String(100), nullable=False)
+    parameter = db.Column(db.String(30), nullable=False)
+    reading_count = db.Column(db.Integer, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    fast_mean = db.Column(db.Float, nullable=False)
+    value_mean = db.Column(db.Float, nullable=False)
+    value_mean_sq = db.Column(db.Float, nullable=False)
+    noise_mean_sq = db.Column(db.Float)
+    rate_mean = db.Column(db.Float)
+    rate_mean_sq = db.Column(db.Float)
+    # Load averages and the temperature x load cross term, for temperatures only
+    load_mean = db.Column(db.Float)
+    load_mean_sq = db.Column(db.Float)
+    cross_mean = db.Column(db.Float)
+
+    __table_args__ = (
+        db.UniqueConstraint('substation_name', 'bay_name', 'parameter', name='uq_anomaly_state_location'),
+    )
+
+class TransformerDay(db.Model):
+    # Loading, hot-spot and aging results of one transformer and day, stamped
+    # with the day's data version so only days written to since are recomputed
+    id = db.Column(db.Integer, primary_key=True)
+    substation_name = db.Column(db.String(100), nullable=False)
+    bay_name = db.Column(db.String(100), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    data_version = db.Column(db.Integer, nullable=False)
+    reading_count = db.Column(db.Integer, nullable=False)
+    covered_hours = db.Column(db.Float, nullable=False)
+    max_loading = db.Column(db.Float)
+    max_oil_temp = db.Column(db.Float)
+    max_hot_spot = db.Column(db.Float)
+    # Equivalent aging: hours of normal life consumed at the reference hot spot
+    aging_hours = db.Column(db.Float, nullable=False)
+    tap_operations = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('substation_name', 'bay_name', 'bucket_start', name='uq_transformer_day'),
+        db.Index('ix_transformer_day_bay', 'bay_name', 'bucket_start'),
+    )
+
+# Request Instrumentation
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Covers executing the statement only. Rows are fetched after this, and
+    # SQLite does most of a query's work while they are fetched, so the time
+    # is reported as execute time rather than as the time spent in the database.
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context() and 'request_started' in g:
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+        if current_app.config['SLOW_REQUEST_SECONDS'] is not None:
+            g.sql_statements.append((elapsed, statement))
+
+@before_render_template.connect
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect
+def stop_render_timer(sender, template, context, **extra):
+    if 'render_started' in g:
+        add_phase_time('render', time.perf_counter() - g.pop('render_started'))
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.sql_count, g.sql_seconds, g.sql_statements = 0, 0.0, []
+    g.phase_times = OrderedDict()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    # Streamed exports are timed up to the first chunk; the rest is sent after this hook
+    if 'request_started' not in g:
+        return response
+    total = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+    timings = [('sql-execute', g.sql_seconds, f'{g.sql_count} queries')] + \
+              [(name, seconds, None) for name, seconds in g.phase_times.items()] + [('total', total, None)]
+    response.headers['Server-Timing'] = ', '.join(
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="{description}"' if description else '')
+        for name, seconds, description in timings)
+
+    observe_request(request.method, route, total, g.sql_count, g.sql_seconds)
+
+    slow_limit = current_app.config['SLOW_REQUEST_SECONDS']
+    if slow_limit is not None and total >= slow_limit:
+        slowest = sorted(g.sql_statements, key=lambda item: item[0], reverse=True)[:SLOW_REQUEST_QUERY_LIMIT]
+        current_app.logger.warning(
+            f"Slow request {request.method} {route}: {total:.3f}s "
+            f"({response.headers['Server-Timing']})" +
+            ''.join(f"\n  {elapsed * 1000:.1f}ms {' '.join(statement.split())}" for elapsed, statement in slowest))
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    # Counters are kept per process and labelled with its pid. Behind several
+    # gunicorn workers a scrape reaches whichever worker answers, so query them
+    # per pid and then add up, e.g. sum by (route) (rate(...[5m])).
+    return Response(render_request_metrics(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/', methods=['GET', 'POST'])
 def index():
-    records = MeasurementRecord.query.order_by(MeasurementRecord.timestamp.desc()).all()
-    
     if request.method == 'POST' and 'submit_measurement' in request.form:
         try:
-            # Validate common fields
-            required_common_fields = ['element_type', 'substation_name', 'bay_name', 'voltage_level', 'relay_type']
-            for field in required_common_fields:
-                if not request.form.get(field):
-                    raise ValueError(f"Missing required field: {field}")
-
-            record_data = {
-                'element_type': request.form['element_type'],
-                'substation_name': request.form['substation_name'],
-                'bay_name': request.form['bay_name'],
-                'voltage_level': request.form['voltage_level'],
-                'relay_type': request.form['relay_type']
-            }
-
-            if record_data['element_type'] == 'transformer':
-                if not request.form.get('winding_type'):
-                    raise ValueError("Missing required field: winding_type")
-                record_data.update(process_transformer_data(request.form))
+            reading = validate_measurement(request.form)
+            if current_app.config['INGEST_WRITE_BEHIND']:
+                ingest_writer.submit([reading])
+                flash('Measurement queued for saving', 'success')
             else:
-                record_data.update(process_line_data(request.form))
-
-            record = MeasurementRecord(**record_data)
-            db.session.add(record)
-            db.session.flush()
-
-            if record.element_type == 'line':
-                process_phase_measurements(record.id, request.form)
-
-            db.session.commit()
-            flash('Measurement saved successfully!', 'success')
-            return redirect(url_for('index'))
+                store_measurements([reading])
+                db.session.commit()
+                flash('Measurement saved successfully!', 'success')
+            return redirect(url_for('main.index'))
 
         except ValueError as ve:
             db.session.rollback()
             flash(f'Validation error: {str(ve)}', 'danger')
-            app.logger.error(f"Validation error: {str(ve)}")
+            current_app.logger.error(f"Validation error: {str(ve)}")
         except Exception as e:
             db.session.rollback()
             flash(f'Database error: {str(e)}', 'danger')
-            app.logger.error(f"Database error: {str(e)}", exc_info=True)
+            current_app.logger.error(f"Database error: {str(e)}", exc_info=True)
+
+    listing_filters = get_listing_filters(request.args)
+    with timed_phase('load'):
+        try:
+            records, next_cursor = get_record_page(listing_filters, request.args.get('cursor'))
+        except ValueError as ve:
+            flash(str(ve), 'warning')
+            records, next_cursor = get_record_page(listing_filters)
+
+    return render_template('index.html',
+                         records=records,
+                         next_cursor=next_cursor,
+                         listing_filters=listing_filters,
+                         stream_retry_seconds=STREAM_RETRY_SECONDS)
+
+@bp.route('/api/measurements', methods=['POST'])
+@csrf.exempt
+def ingest_batch():
+    try:
+        if request.is_json:
+            payload = request.get_json(silent=True)
+            if payload is None:
+                raise ValueError("Body is not valid JSON")
+            rows = payload.get('measurements') if isinstance(payload, dict) else payload
+            if not isinstance(rows, list):
+                raise ValueError("Expected a list of measurements")
+        else:
+            upload = request.files.get('file')
+            text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True)
+            rows = list(csv.DictReader(StringIO(text)))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'Invalid batch: {str(e)}'}), 400
+
+    if len(rows) > INGEST_BATCH_SIZE:
+        return jsonify({'error': f'Batch exceeds {INGEST_BATCH_SIZE} measurements'}), 413
+
+    try:
+        if current_app.config['INGEST_WRITE_BEHIND']:
+            readings, errors = validate_ingest_rows(rows)
+            ingest_writer.submit(readings)
+            return jsonify({'queued': len(readings), 'failed': len(errors), 'errors': errors}), 202
+        inserted, errors = ingest_measurements(rows)
+    except Exception as e:
+        current_app.logger.error(f"Batch ingest error: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+    return jsonify({'inserted': inserted, 'failed': len(errors), 'errors': errors})
 
-    return render_template('index.html', records=records)
+@bp.route('/api/bays')
+def bay_options():
+    return jsonify({'bays': get_bays(request.args.get('substation') or None)})
 
-@app.route('/export', methods=['POST'])
+@bp.route('/records')
+def records_page():
+    try:
+        listing_filters = get_listing_filters(request.args)
+        records, next_cursor = get_record_page(listing_filters, request.args.get('cursor'))
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    return jsonify({
+        'records': [{
+            'id': r.key,
+            'timestamp': r.timestamp.strftime('%Y-%m-%d %H:%M'),
+            'substation_name': r.substation_name,
+            'bay_name': r.bay_name,
+            'voltage_level': r.voltage_level,
+            'element_type': r.element_type,
+            'relay_type': r.relay_type
+        } for r in records],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/stream')
+def measurement_events():
+    max_clients = current_app.config['STREAM_MAX_CLIENTS']
+    if measurement_stream.client_count() >= max_clients:
+        response = jsonify({'error': 'Too many live listings are open; try again shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_RETRY_SECONDS)
+        return response
+    return Response(measurement_stream.listen(get_listing_filters(request.args), max_clients),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/export', methods=['POST'])
 def export_data():
     try:
-        record_ids = request.form.getlist('record_ids')
-        if not record_ids:
-            flash('No records selected for export', 'warning')
+        export_format = request.form.get('format', 'xlsx')
+        if export_format not in ('xlsx', 'csv', 'parquet'):
+            raise ValueError(f"Unsupported export format: {export_format}")
+
+        if request.form.get('export_scope') == 'filtered':
+            if current_app.config['REPORT_JOBS']:
+                return redirect(url_for('main.report_job', job_id=submit_report_job('export', request.form)))
+            chunks = iter_export_chunks(filters=get_report_filters(request.form))
+        else:
+            record_ids = request.form.getlist('record_ids')
+            if not record_ids:
+                flash('No records selected for export', 'warning')
+                return redirect('/')
+            chunks = iter_export_chunks(record_ids=record_ids)
+
+        chunks, download_name = open_export(chunks, export_format)
+        if chunks is None:
+            flash('No records match the export filters', 'warning')
             return redirect('/')
 
-        records = MeasurementRecord.query.filter(MeasurementRecord.id.in_(record_ids)).all()
-        output = BytesIO()
-
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Summary Sheet
-            summary_data = [{
-                'ID': r.id,
-                'Timestamp': r.timestamp.strftime('%Y-%m-%d %H:%M'),
-                'Substation': r.substation_name,
-                'Bay': r.bay_name,
-                'Voltage Level': r.voltage_level,
-                'Relay Type': r.relay_type
-            } for r in records]
-            pd.DataFrame(summary_data).to_excel(writer, sheet_name='Summary', index=False)
-
-            # Detailed Sheets
-            for record in records:
-                sheet_name = f"{record.bay_name}_{record.id}"[:31]  # Excel sheet name limit
-                start_row = 0
-
-                # Add element-specific data
-                if record.element_type == 'transformer':
-                    transformer_data = {
-                        'Tap Position': [record.tap_position],
-                        'Oil Temperature (°C)': [record.oil_temp],
-                        'HV Winding Temp (°C)': [record.hv_winding_temp],
-                        'MV Winding Temp (°C)': [record.mv_winding_temp],
-                        'LV Winding Temp (°C)': [record.lv_winding_temp],
-                        'HV Active Power (MW)': [record.hv_active_power],
-                        'HV Reactive Power (MVAR)': [record.hv_reactive_power],
-                        'MV Active Power (MW)': [record.mv_active_power],
-                        'MV Reactive Power (MVAR)': [record.mv_reactive_power],
-                        'LV Active Power (MW)': [record.lv_active_power],
-                        'LV Reactive Power (MVAR)': [record.lv_reactive_power],
-                        'HV CT Ratio': [record.hv_ct_ratio],
-                        'MV CT Ratio': [record.mv_ct_ratio],
-                        'LV CT Ratio': [record.lv_ct_ratio]
-                    }
-                    pd.DataFrame(transformer_data).to_excel(
-                        writer, sheet_name=sheet_name, startrow=start_row, index=False)
-                    start_row += 14
-
-                else:
-                    line_data = {
-                        'Active Power (MW)': [record.active_power],
-                        'Reactive Power (MVAR)': [record.reactive_power],
-                        'CT Ratio': [record.ct_ratio]
-                    }
-                    pd.DataFrame(line_data).to_excel(
-                        writer, sheet_name=sheet_name, startrow=start_row, index=False)
-                    start_row += 5
-
-                # Currents
-                currents = [[c.phase, c.value] for c in record.phase_currents]
-                currents_df = pd.DataFrame(currents, columns=['Phase', 'Value (A)'])
-                currents_df.to_excel(writer, sheet_name=sheet_name, startrow=start_row, index=False)
-                start_row += len(currents_df) + 3
-
-                # Voltages
-                voltages = [[v.phase, v.value] for v in record.phase_voltages]
-                voltages_df = pd.DataFrame(voltages, columns=['Phase', 'Value (kV)'])
-                voltages_df.to_excel(writer, sheet_name=sheet_name, startrow=start_row, index=False)
-                start_row += len(voltages_df) + 3
-
-                # Sequences
-                sequences = [[s.component, s.value] for s in record.sequence_components]
-                sequences_df = pd.DataFrame(sequences, columns=['Component', 'Value'])
-                sequences_df.to_excel(writer, sheet_name=sheet_name, startrow=start_row, index=False)
-
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            download_name=f"{records[0].substation_name}_substation_data_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-            as_attachment=True
-        )
+        if export_format == 'xlsx':
+            return send_file(
+                write_xlsx_export(chunks),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                download_name=download_name,
+                as_attachment=True
+            )
+
+        if export_format == 'csv':
+            body, mimetype = stream_csv_export(chunks), 'text/csv'
+        else:
+            body, mimetype = stream_parquet_export(chunks), 'application/vnd.apache.parquet'
+
+        return Response(stream_with_context(body), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{download_name}"'
+        })
 
     except Exception as e:
         flash(f'Export failed: {str(e)}', 'danger')
         return redirect('/')
 
 # Report Routes
-@app.route('/reports')
+@bp.route('/reports')
 def reports_dashboard():
     return render_template('reports_dashboard.html')
 
-@app.route('/reports/summary', methods=['GET', 'POST'])
+@bp.route('/reports/summary', methods=['GET', 'POST'])
 def summary_report():
-    substations = get_unique_values(MeasurementRecord.substation_name)
-    bays = get_unique_values(MeasurementRecord.bay_name)
-
-    if request.method == 'POST':
-        filter_data = get_report_filters(request.form)
-        records = get_filtered_records(filter_data)
-        report_data = {
-            'currents': generate_phase_report(records, 'current'),
-            'voltages': generate_phase_report(records, 'voltage'),
-            'sequence_components': generate_sequence_report(records),
-            'summary_stats': generate_summary_statistics(records)
-        }
-        return render_template('summary_report.html',
-                            report_data=report_data,
-                            filters=filter_data,
-                            substations=substations,
-                            bays=bays)
+    if request.method == 'POST' or request.args:
+        return serve_report('summary', request.form if request.method == 'POST' else request.args)
 
     return render_template('summary_report_form.html',
-                         substations=substations,
-                         bays=bays)
+                         substations=get_substations(),
+                         bays=get_bays())
 
-@app.route('/reports/thresholds', methods=['GET', 'POST'])
+@bp.route('/reports/thresholds', methods=['GET', 'POST'])
 def threshold_report():
-    thresholds = {'current': 1600, 'voltage': 500, 'I0': 50, 'V0': 50}
-    substations = get_unique_values(MeasurementRecord.substation_name)
-    bays = get_unique_values(MeasurementRecord.bay_name)
-
-    if request.method == 'POST':
-        filter_data = get_report_filters(request.form)
-        records = get_filtered_records(filter_data)
-        alerts = check_thresholds(records, thresholds)
-        return render_template('threshold_report.html',
-                             alerts=alerts,
-                             thresholds=thresholds,
-                             filters=filter_data,
-                             substations=substations,
-                             bays=bays)
+    if request.method == 'POST' or request.args:
+        return serve_report('thresholds', request.form if request.method == 'POST' else request.args)
 
+    limits = get_threshold_limits()
     return render_template('threshold_report_form.html',
-                         substations=substations,
-                         bays=bays,
-                         thresholds=thresholds)
+                         substations=get_substations(),
+                         bays=get_bays(),
+                         limits=limits.astype(object).where(limits.notna(), None).to_dict('records'))
 
-@app.route('/reports/trends', methods=['GET', 'POST'])
+@bp.route('/reports/trends', methods=['GET', 'POST'])
 def trend_analysis():
     parameters = ['IA', 'IB', 'IC', 'VA', 'VB', 'VC', 'I0', 'I1', 'I2', 'V0', 'V1', 'V2']
 
-    if request.method == 'POST':
-        filter_data = get_report_filters(request.form)
-        selected_params = request.form.getlist('parameters')
-        plot_data = generate_trend_plot(filter_data, selected_params)
-        return render_template('trend_analysis.html',
-                             plot_data=plot_data,
-                             parameters=selected_params,
-                             filters=filter_data,
-                             substations=get_unique_values(MeasurementRecord.substation_name),
-                             bays=get_unique_values(MeasurementRecord.bay_name))
+    if request.method == 'POST' or request.args:
+        return serve_report('trends', request.form if request.method == 'POST' else request.args)
 
     return render_template('trend_analysis_form.html',
                          parameters=parameters,
-                         substations=get_unique_values(MeasurementRecord.substation_name),
-                         bays=get_unique_values(MeasurementRecord.bay_name))
+                         substations=get_substations(),
+                         bays=get_bays())
+
+@bp.route('/reports/transformers', methods=['GET', 'POST'])
+def transformer_report():
+    if request.method == 'POST' or request.args:
+        return serve_report('transformers', request.form if request.method == 'POST' else request.args)
+
+    return render_template('transformer_report_form.html',
+                         substations=get_substations(),
+                         bays=get_bays())
+
+@bp.route('/jobs/<job_id>')
+def report_job(job_id):
+    status = read_job_status(job_id)
+    if status is None:
+        flash('Report job not found; it may have expired', 'warning')
+        return redirect(url_for('main.reports_dashboard'))
+    if status['state'] == 'done' and 'result.html' in status['files']:
+        return send_file(os.path.join(get_job_dir(job_id), 'result.html'), mimetype='text/html')
+    return render_template('report_job.html', job=status)
+
+@bp.route('/jobs/<job_id>/status')
+def report_job_status(job_id):
+    status = read_job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(status)
+
+@bp.route('/jobs/<job_id>/files/<name>')
+def report_job_file(job_id, name):
+    status = read_job_status(job_id)
+    if status is None or status['state'] != 'done' or name not in status['files']:
+        return jsonify({'error': 'Unknown file'}), 404
+    return send_file(os.path.join(get_job_dir(job_id), name), as_attachment=name != 'result.html')
 
 # Helper Functions
-def get_unique_values(column):
-    return [v[0] for v in db.session.query(column).distinct().all()]
+@contextmanager
+def timed_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(name, time.perf_counter() - started)
+
+def add_phase_time(name, seconds):
+    if has_request_context() and 'phase_times' in g:
+        g.phase_times[name] = g.phase_times.get(name, 0.0) + seconds
+
+def observe_request(method, route, seconds, sql_count, sql_seconds):
+    with request_metrics_lock:
+        metric = request_metrics.setdefault((method, route), {
+            'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0, 'sql_count': 0, 'sql_seconds': 0.0
+        })
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                metric['buckets'][index] += 1
+        metric['count'] += 1
+        metric['sum'] += seconds
+        metric['sql_count'] += sql_count
+        metric['sql_seconds'] += sql_seconds
+
+def render_request_metrics():
+    with request_metrics_lock:
+        snapshot = {key: dict(metric, buckets=list(metric['buckets'])) for key, metric in request_metrics.items()}
+
+    pid = f'pid="{os.getpid()}"'
+    lines = ['# HELP substation_request_duration_seconds Request latency by route, per worker process.',
+             '# TYPE substation_request_duration_seconds histogram']
+    for (method, route), metric in sorted(snapshot.items()):
+        labels = f'{pid},method="{method}",route="{route}"'
+        for bound, count in zip(LATENCY_BUCKETS, metric['buckets']):
+            lines.append(f'substation_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'substation_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metric["count"]}')
+        lines.append(f'substation_request_duration_seconds_sum{{{labels}}} {metric["sum"]:.6f}')
+        lines.append(f'substation_request_duration_seconds_count{{{labels}}} {metric["count"]}')
+
+    for name, key, kind, description in [
+        ('substation_request_sql_queries_total', 'sql_count', 'counter', 'SQL statements executed by route.'),
+        ('substation_request_sql_execute_seconds_total', 'sql_seconds', 'counter',
+         'Statement execute time by route; excludes fetching the rows.'),
+    ]:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        for (method, route), metric in sorted(snapshot.items()):
+            lines.append(f'{name}{{{pid},method="{method}",route="{route}"}} {metric[key]}')
+    lines += ['# HELP substation_ingest_queue_depth Readings waiting for the write-behind writer.',
+              '# TYPE substation_ingest_queue_depth gauge',
+              f'substation_ingest_queue_depth{{{pid}}} {ingest_writer.pending()}',
+              '# HELP substation_ingest_dropped_total Queued readings dropped after failing to write.',
+              '# TYPE substation_ingest_dropped_total counter',
+              f'substation_ingest_dropped_total{{{pid}}} {ingest_writer.dropped}']
+    return '\n'.join(lines) + '\n'
+
+def serve_report(kind, form_data):
+    # Reports are answered with a weak ETag over the cache key, so a browser or
+    # proxy revalidating an unchanged report costs one data version query.
+    cache_key = get_report_cache_key(kind, form_data)
+    # The threshold page is sliced after the cache, so only the ETag depends on it
+    etag = hashlib.sha1(f"{cache_key}:{form_data.get('page', '')}".encode()).hexdigest()
+    if request.method == 'GET' and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif current_app.config['REPORT_JOBS'] and cache_key not in get_report_cache():
+        return queue_report_job(kind, form_data)
+    else:
+        response = make_response(render_report(kind, form_data, cache_key))
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def render_report(kind, form_data, cache_key=None):
+    context = get_report_context(kind, form_data, cache_key)
+    if kind == 'thresholds':
+        context = paginate_alerts(context, form_data.get('page', 1, type=int))
+    return render_template(REPORT_TEMPLATES[kind],
+                         **context,
+                         substations=get_substations(),
+                         bays=get_bays())
+
+def get_report_cache_key(kind, form_data):
+    filter_data = get_report_filters(form_data)
+    version_filters = filter_data
+    if kind == 'transformers' and filter_data['start_date']:
+        # The first day's aging looks back at the readings of the day before
+        start = datetime.strptime(filter_data['start_date'], '%Y-%m-%d') - timedelta(days=1)
+        version_filters = dict(filter_data, start_date=f'{start:%Y-%m-%d}')
+    key = [kind, sorted((name, value or None) for name, value in filter_data.items()),
+           get_data_version(version_filters)]
+    if kind == 'transformers':
+        key.append(get_transformer_day_version(version_filters))
+    if kind == 'trends':
+        key.append(form_data.getlist('parameters'))
+    if kind == 'thresholds':
+        key.append(get_threshold_mode(form_data))
+        key.append(get_threshold_limits().to_json(orient='records'))
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+def get_report_context(kind, form_data, cache_key=None):
+    cache_key = cache_key or get_report_cache_key(kind, form_data)
+    context = get_report_cache().get(cache_key)
+    if context is None:
+        builder = {'summary': build_summary_report, 'thresholds': build_threshold_report,
+                   'trends': build_trend_report, 'transformers': build_transformer_report}[kind]
+        context = builder(form_data)
+        get_report_cache().set(cache_key, context)
+    return context
+
+def build_summary_report(form_data):
+    filter_data = get_report_filters(form_data)
+    with timed_phase('aggregate'):
+        report_data = {
+            'currents': generate_phase_report(filter_data, 'current'),
+            'voltages': generate_phase_report(filter_data, 'voltage'),
+            'sequence_components': generate_sequence_report(filter_data),
+            'summary_stats': generate_summary_statistics(filter_data)
+        }
+    return {'report_data': report_data, 'filters': filter_data}
+
+def build_threshold_report(form_data):
+    # Every alert is cached so paging through them is served from the cache
+    limits = get_threshold_limits()
+    filter_data = get_report_filters(form_data)
+    mode = get_threshold_mode(form_data)
+    with timed_phase('load'):
+        report_frame = load_report_data(filter_data, record_fields=RECORD_LIMIT_FIELDS)
+    with timed_phase('aggregate'):
+        alerts = detect_anomalies(report_frame) if mode == 'anomalies' else check_thresholds(report_frame, limits)
+    return {'alerts': alerts,
+            'limits': limits.astype(object).where(limits.notna(), None).to_dict('records'),
+            'filters': filter_data,
+            'mode': mode,
+            'anomaly_settings': {'fast_span': ANOMALY_FAST_SPAN, 'slow_span': ANOMALY_SLOW_SPAN,
+                                 'min_readings': ANOMALY_MIN_READINGS, 'drift_limit': ANOMALY_DRIFT_LIMIT,
+                                 'z_limit': ANOMALY_Z_LIMIT}}
+
+def get_threshold_mode(form_data):
+    return 'anomalies' if form_data.get('mode') == 'anomalies' else 'limits'
+
+def paginate_alerts(context, page):
+    alerts = context['alerts']
+    total_alerts = len(alerts)
+    page_count = max((total_alerts + THRESHOLD_PAGE_SIZE - 1) // THRESHOLD_PAGE_SIZE, 1)
+    page = min(max(page, 1), page_count)
+    return dict(context,
+                alerts=alerts.iloc[(page - 1) * THRESHOLD_PAGE_SIZE:page * THRESHOLD_PAGE_SIZE],
+                total_alerts=total_alerts,
+                page=page,
+                page_count=page_count)
+
+def build_trend_report(form_data):
+    filter_data = get_report_filters(form_data)
+    selected_params = form_data.getlist('parameters')
+    return {'plot_data': get_trend_plot(filter_data, selected_params),
+            'parameters': selected_params,
+            'filters': filter_data}
+
+def build_transformer_report(form_data):
+    filter_data = get_report_filters(form_data)
+    with timed_phase('load'):
+        days = get_transformer_days(filter_data)
+    with timed_phase('aggregate'):
+        transformers = summarize_transformer_days(days)
+    fleet = None
+    if not transformers.empty:
+        fleet = {'transformers': len(transformers),
+                 'aging_hours': round(float(transformers['aging_hours'].sum()), 1),
+                 'max_hot_spot': round(float(transformers['max_hot_spot'].max()), 1),
+                 'tap_operations': int(transformers['tap_operations'].sum())}
+    return {'transformers': transformers,
+            'fleet': fleet,
+            'stale_days': len(find_stale_transformer_days(filter_data)),
+            'filters': filter_data,
+            'thermal_settings': {'hot_spot_factor': TRANSFORMER_HOT_SPOT_FACTOR,
+                                 'winding_gradient': TRANSFORMER_WINDING_GRADIENT,
+                                 'winding_exponent': TRANSFORMER_WINDING_EXPONENT,
+                                 'reference_hot_spot': TRANSFORMER_REFERENCE_HOT_SPOT,
+                                 'aging_doubling': TRANSFORMER_AGING_DOUBLING,
+                                 'normal_life_hours': TRANSFORMER_NORMAL_LIFE_HOURS}}
+
+def open_export(chunks, export_format):
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return None, None
+    download_name = f"{first_chunk['substation'].iloc[0]}_substation_data_" \
+                    f"{datetime.now().strftime('%Y%m%d_%H%M')}.{export_format}"
+    return chain([first_chunk], chunks), download_name
+
+def queue_report_job(kind, form_data):
+    try:
+        return redirect(url_for('main.report_job', job_id=submit_report_job(kind, form_data)))
+    except ValueError as ve:
+        flash(str(ve), 'warning')
+        return redirect(request.path)
+
+def get_job_dir(job_id):
+    return os.path.join(current_app.config['REPORT_JOB_DIR'], job_id)
+
+def read_job_status(job_id):
+    if not re.fullmatch(r'[0-9a-f]{40}', job_id):
+        return None
+    try:
+        with open(os.path.join(get_job_dir(job_id), 'status.json')) as status_file:
+            return json.load(status_file)
+    except (OSError, ValueError):
+        return None
+
+def write_job_status(job_id, **status):
+    # Written to a temporary file and renamed so pollers never see half a file
+    status = dict(status, id=job_id, updated=time.time())
+    path = os.path.join(get_job_dir(job_id), 'status.json')
+    with open(path + '.tmp', 'w') as status_file:
+        json.dump(status, status_file)
+    os.replace(path + '.tmp', path)
+    return status
+
+def get_report_job_pool():
+    # Spawned rather than forked: the parent may hold database connections,
+    # the write-behind thread and cache locks that must not be copied.
+    with report_job_lock:
+        pool = current_app.extensions.get('report_job_pool')
+        if pool is None:
+            pool = current_app.extensions['report_job_pool'] = create_job_pool(current_app.config['REPORT_JOB_WORKERS'])
+            atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+        return pool
+
+def create_job_pool(max_workers):
+    # Spawned workers import the app module afresh, so they are handed this
+    # app's settings instead of rebuilding them from the environment
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_job_process,
+                               initargs=({key: current_app.config[key] for key in JOB_CONFIG_KEYS},))
+
+def init_job_process(config):
+    global job_config
+    job_config = config
+
+def submit_report_job(kind, form_data):
+    # Identical submissions share a job id, so a request that matches a queued
+    # or running job just follows it instead of starting another.
+    form_items = sorted((key, value) for key, value in form_data.items(multi=True) if key != 'csrf_token')
+    job_id = hashlib.sha1(json.dumps([kind, form_items]).encode()).hexdigest()
+    remove_expired_jobs()
+    os.makedirs(get_job_dir(job_id), exist_ok=True)
+
+    with report_job_lock:
+        status = read_job_status(job_id)
+        if status and status['state'] in ('queued', 'running') and \
+                time.time() - status['updated'] < REPORT_JOB_TIMEOUT:
+            return job_id
+        for finished in [key for key, future in report_job_futures.items() if future.done()]:
+            del report_job_futures[finished]
+        if len(report_job_futures) >= REPORT_JOB_MAX_PENDING:
+            raise ValueError('Too many reports are being prepared; try again shortly')
+        write_job_status(job_id, kind=kind, state='queued', files=[], error=None)
+    future = get_report_job_pool().submit(run_report_job, job_id, kind, form_items)
+    with report_job_lock:
+        report_job_futures[job_id] = future
+    return job_id
+
+def remove_expired_jobs():
+    root = current_app.config['REPORT_JOB_DIR']
+    for job_id in os.listdir(root) if os.path.isdir(root) else []:
+        status = read_job_status(job_id)
+        if status and status['state'] in ('done', 'failed') and time.time() - status['updated'] > REPORT_JOB_RETENTION:
+            shutil.rmtree(os.path.join(root, job_id), ignore_errors=True)
+
+def run_report_job(job_id, kind, form_items):
+    # Runs in a pool process with its own app, built once per process
+    from werkzeug.datastructures import ImmutableMultiDict
+    form_data = ImmutableMultiDict(form_items)
+    with get_job_app().test_request_context():
+        job_dir = get_job_dir(job_id)
+        write_job_status(job_id, kind=kind, state='running', files=[], error=None)
+        try:
+            if kind == 'export':
+                files = write_export_job(form_data, job_dir)
+            else:
+                with open(os.path.join(job_dir, 'result.html'), 'w', encoding='utf-8') as output:
+                    output.write(render_report(kind, form_data))
+                files = ['result.html']
+                if kind == 'trends':
+                    files += write_trend_plot_file(form_data, job_dir)
+        except Exception as e:
+            current_app.logger.error(f"Report job {job_id} failed: {str(e)}", exc_info=True)
+            write_job_status(job_id, kind=kind, state='failed', files=[], error=str(e))
+            return
+        write_job_status(job_id, kind=kind, state='done', files=files, error=None)
+
+@cache
+def get_job_app():
+    return create_app(job_config)
+
+def write_trend_plot_file(form_data, job_dir):
+    # Served from the report cache filled while rendering the report
+    plot_data = get_report_context('trends', form_data)['plot_data']
+    if plot_data is None:
+        return []
+    with open(os.path.join(job_dir, 'trend.png'), 'wb') as output:
+        output.write(base64.b64decode(plot_data))
+    return ['trend.png']
+
+def write_export_job(form_data, job_dir):
+    export_format = form_data.get('format', 'xlsx')
+    if export_format not in ('xlsx', 'csv', 'parquet'):
+        raise ValueError(f"Unsupported export format: {export_format}")
+    chunks, download_name = open_export(iter_export_chunks(filters=get_report_filters(form_data)), export_format)
+    if chunks is None:
+        raise ValueError('No records match the export filters')
+
+    with open(os.path.join(job_dir, download_name), 'wb') as output:
+        if export_format == 'xlsx':
+            shutil.copyfileobj(write_xlsx_export(chunks), output)
+        elif export_format == 'csv':
+            for text in stream_csv_export(chunks):
+                output.write(text.encode('utf-8'))
+        else:
+            for data in stream_parquet_export(chunks):
+                output.write(data)
+    return [download_name]
+
+def read_batch_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, 'manifest.json')) as manifest_file:
+            return json.load(manifest_file)['reports']
+    except FileNotFoundError:
+        return {}
+
+def write_batch_manifest(output_dir, reports):
+    path = os.path.join(output_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump({'reports': reports}, manifest_file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def write_substation_report(substation, filters, formats, output_dir):
+    # Runs in a pool process with its own app. Every format is rendered from
+    # the same content, built from one load of the substation's readings.
+    with get_job_app().app_context():
+        blocks = build_substation_report(substation, filters)
+        files = []
+        for export_format in formats:
+            name = f"{secure_filename(substation) or 'substation'}.{export_format}"
+            path = os.path.join(output_dir, name)
+            # Renamed into place, so an interrupted run never leaves a half-written report
+            {'pdf': write_pdf_report, 'docx': write_docx_report}[export_format](blocks, path + '.tmp')
+            os.replace(path + '.tmp', path)
+            files.append(name)
+        return files
+
+def build_substation_report(substation, filters):
+    # The document as a list of (kind, content) blocks for the format writers
+    report_frame = load_report_data(filters, record_fields=RECORD_LIMIT_FIELDS)
+    records, measurements = report_frame['records'], report_frame['measurements']
+    blocks = [('title', f'{substation} Substation Report'),
+              ('paragraph', f"Period: {filters['start_date']} to {filters['end_date']}")]
+    if records.empty:
+        return blocks + [('paragraph', 'No measurements were recorded in this period.')]
+    blocks.append(('paragraph', f"{len(records)} records from {records['bay'].nunique()} bays, "
+                                f"{records['timestamp'].min():%Y-%m-%d %H:%M} to "
+                                f"{records['timestamp'].max():%Y-%m-%d %H:%M}"))
+
+    stats = measurements.groupby(['bay', 'parameter'], observed=True)['value'].agg(['min', 'max', 'mean', 'std'])
+    for title, parameters in BATCH_REPORT_SECTIONS:
+        section = stats[stats.index.get_level_values('parameter').isin(parameters)]
+        blocks.append(('heading', title))
+        if section.empty:
+            blocks.append(('paragraph', 'No data available'))
+            continue
+        blocks.append(('table', ['Bay', 'Parameter', 'Min', 'Max', 'Avg', 'Std Dev'],
+                       [[bay, parameter, *[format_report_value(value) for value in row]]
+                        for (bay, parameter), row in section.iterrows()]))
+        plot_data = generate_trend_plot(report_frame, [parameter for parameter in parameters
+                                                       if parameter in set(section.index.get_level_values(1))])
+        if plot_data:
+            blocks.append(('image', base64.b64decode(plot_data)))
+
+    alerts = check_thresholds(report_frame, get_threshold_limits())
+    blocks.append(('heading', f'Threshold Alerts ({len(alerts)})'))
+    if alerts.empty:
+        blocks.append(('paragraph', 'No threshold breaches detected'))
+    else:
+        blocks.append(('table', ['Timestamp', 'Bay', 'Type', 'Parameter', 'Limit', 'Value', 'Threshold'],
+                       [[f'{alert.timestamp:%Y-%m-%d %H:%M}', alert.bay, alert.type, alert.parameter, alert.limit,
+                         format_report_value(alert.value), format_report_value(alert.threshold)]
+                        for alert in alerts.head(BATCH_REPORT_MAX_ALERTS).itertuples()]))
+        if len(alerts) > BATCH_REPORT_MAX_ALERTS:
+            blocks.append(('paragraph', f'{len(alerts) - BATCH_REPORT_MAX_ALERTS} more alerts are listed in the '
+                                        f'threshold report.'))
+
+    transformers = summarize_transformer_days(get_transformer_days(filters))
+    if not transformers.empty:
+        blocks.append(('heading', 'Transformer Loading & Aging'))
+        blocks.append(('table', ['Bay', 'Max Loading (pu)', 'Max Hot Spot (C)', 'Aging (h)', 'Loss of Life (%)',
+                                 'Tap Operations'],
+                       [[bay, format_report_value(row['max_loading']), format_report_value(row['max_hot_spot'], 1),
+                         format_report_value(row['aging_hours'], 1), format_report_value(row['loss_of_life'], 3),
+                         str(int(row['tap_operations']))]
+                        for (_, bay), row in transformers.iterrows()]))
+    return blocks
+
+def format_report_value(value, digits=2):
+    return '-' if pd.isna(value) else f'{value:.{digits}f}'
+
+def write_pdf_report(blocks, path):
+    from xml.sax.saxutils import escape
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    document = SimpleDocTemplate(path, pagesize=A4, leftMargin=1.5 * cm, rightMargin=1.5 * cm,
+                                 topMargin=1.5 * cm, bottomMargin=1.5 * cm)
+    table_style = TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#343a40')),
+                              ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                              ('FONTSIZE', (0, 0), (-1, -1), 7),
+                              ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+                              ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f2f2f2')])])
+    flowables = []
+    for kind, *content in blocks:
+        if kind in ('title', 'heading', 'paragraph'):
+            style = {'title': 'Title', 'heading': 'Heading2', 'paragraph': 'BodyText'}[kind]
+            flowables.append(Paragraph(escape(content[0]), styles[style]))
+        elif kind == 'table':
+            header, rows = content
+            flowables.append(Table([header] + rows, repeatRows=1, style=table_style))
+        elif kind == 'image':
+            width, height = ImageReader(BytesIO(content[0])).getSize()
+            flowables.append(Image(BytesIO(content[0]), width=document.width,
+                                   height=document.width * height / width))
+        flowables.append(Spacer(1, 0.3 * cm))
+    document.build(flowables)
+
+def write_docx_report(blocks, path):
+    from docx import Document
+    from docx.shared import Inches, Pt
+
+    document = Document()
+    for kind, *content in blocks:
+        if kind == 'title':
+            document.add_heading(content[0], level=0)
+        elif kind == 'heading':
+            document.add_heading(content[0], level=1)
+        elif kind == 'paragraph':
+            document.add_paragraph(content[0])
+        elif kind == 'table':
+            header, rows = content
+            table = document.add_table(rows=len(rows) + 1, cols=len(header))
+            table.style = 'Light Grid Accent 1'
+            for row, values in zip(table.rows, [header] + rows):
+                for cell, value in zip(row.cells, values):
+                    cell.text = str(value)
+                    cell.paragraphs[0].runs[0].font.size = Pt(8)
+        elif kind == 'image':
+            document.add_picture(BytesIO(content[0]), width=Inches(6.5))
+    document.save(path)
+
+def get_listing_filters(args):
+    return {
+        'substation': args.get('substation', '').strip(),
+        'bay': args.get('bay', '').strip()
+    }
+
+def encode_record_cursor(record):
+    return f"{record.timestamp.isoformat()}_{record.key}"
+
+def decode_record_cursor(cursor):
+    # Default shard keys are bare ids, so "<timestamp>_<id>" cursors from before
+    # sharding still decode. Within a timestamp pages now run by shard and then
+    # id: a cursor taken before split-shards resumes at its timestamp but skips
+    # that timestamp's moved readings with lower ids. Older readings are all listed.
+    try:
+        timestamp, record_key = cursor.split('_', 1)
+        return datetime.fromisoformat(timestamp), *parse_record_key(record_key)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def format_record_key(shard, record_id):
+    # Record ids are only unique within a shard
+    return record_id if shard is None else f'{shard}:{record_id}'
+
+def parse_record_key(record_key):
+    shard, _, record_id = str(record_key).rpartition(':')
+    if shard and shard not in current_app.config['SQLALCHEMY_BINDS']:
+        raise ValueError(f"Unknown shard: {shard}")
+    return shard or None, int(record_id)
+
+def get_record_page(filters, cursor=None, limit=RECORDS_PAGE_SIZE):
+    # Keyset paging on (timestamp, shard, id) keeps every page an index range
+    # scan instead of an OFFSET that re-reads all the newer rows. Each shard
+    # returns its own next page and the newest of them are kept.
+    shards = get_filter_shards(filters)
+    cursor = decode_record_cursor(cursor) if cursor else None
+    pages = query_shards(shards, select_record_page, filters, cursor, limit)
+    records = sorted(chain.from_iterable(pages), reverse=True,
+                     key=lambda record: (record.timestamp, get_shards().index(record.shard), record.id))[:limit + 1]
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_record_cursor(records[-1])
+
+    return records, next_cursor
+
+def select_record_page(filters, cursor, limit):
+    shard = current_shard.get()
+    query = MeasurementRecord.query.options(load_only(
+        MeasurementRecord.timestamp,
+        MeasurementRecord.substation_name,
+        MeasurementRecord.bay_name,
+        MeasurementRecord.voltage_level,
+        MeasurementRecord.element_type,
+        MeasurementRecord.relay_type
+    ))
+
+    if filters['substation']:
+        query = query.filter_by(substation_name=filters['substation'])
+    if filters['bay']:
+        query = query.filter_by(bay_name=filters['bay'])
+    if cursor:
+        timestamp, cursor_shard, record_id = cursor
+        shard_order = get_shards().index(shard) - get_shards().index(cursor_shard)
+        if shard_order < 0:
+            query = query.filter(MeasurementRecord.timestamp <= timestamp)
+        elif shard_order > 0:
+            query = query.filter(MeasurementRecord.timestamp < timestamp)
+        else:
+            query = query.filter(or_(
+                MeasurementRecord.timestamp < timestamp,
+                and_(MeasurementRecord.timestamp == timestamp, MeasurementRecord.id < record_id)
+            ))
+
+    records = query.order_by(MeasurementRecord.timestamp.desc(),
+                             MeasurementRecord.id.desc()).limit(limit + 1).all()
+    for record in records:
+        record.shard = shard
+        record.key = format_record_key(shard, record.id)
+    return records
+
+def get_dimension_cache():
+    with dimension_cache_lock:
+        loaded_at = dimension_cache['loaded_at']
+        if loaded_at is None or (datetime.utcnow() - loaded_at).total_seconds() > DIMENSION_CACHE_TTL:
+            dimensions = query_shards(get_shards(), load_dimensions)
+            dimension_cache.update({
+                'loaded_at': datetime.utcnow(),
+                'substations': {name: substation_id for substations, _ in dimensions
+                                for name, substation_id in substations},
+                'bays': {(substation, bay): (substation_id, bay_id) for _, bays in dimensions
+                         for substation, bay, substation_id, bay_id in bays}
+            })
+        return dimension_cache
+
+def load_dimensions():
+    # Ids are those of the shard the substation lives in
+    substations = db.session.execute(select(Substation.name, Substation.id)).all()
+    bays = db.session.execute(select(Substation.name, Bay.name, Bay.substation_id, Bay.id)
+                              .join(Substation, Bay.substation_id == Substation.id)).all()
+    return substations, bays
+
+def invalidate_dimension_cache():
+    with dimension_cache_lock:
+        dimension_cache['loaded_at'] = None
+
+def get_substations():
+    return sorted(get_dimension_cache()['substations'])
+
+def get_bays(substation=None):
+    return sorted({bay for bay_substation, bay in get_dimension_cache()['bays']
+                   if substation is None or bay_substation == substation})
+
+def get_shards():
+    return [None] + list(current_app.config['SQLALCHEMY_BINDS'])
+
+def get_shard(substation):
+    return current_app.config['SHARD_MAP'].get(substation)
+
+def get_filter_shards(filters):
+    if filters.get('substation'):
+        return [get_shard(filters['substation'])]
+    return get_shards()
+
+@contextmanager
+def use_shard(shard):
+    token = current_shard.set(shard)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+def group_by_shard(items, substations):
+    groups = {}
+    for item, substation in zip(items, substations):
+        groups.setdefault(get_shard(substation), []).append(item)
+    return groups.items()
+
+def query_shards(shards, function, *args):
+    # Runs function once per shard, in parallel when there is more than one,
+    # and returns the partial results in shard order for the caller to merge
+    if len(shards) == 1:
+        with use_shard(shards[0]):
+            return [function(*args)]
+    app = current_app._get_current_object()
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        return list(pool.map(lambda shard: run_on_shard(app, shard, function, args), shards))
+
+def run_on_shard(app, shard, function, args):
+    # Each thread gets its own app context and with it its own session
+    with app.app_context(), use_shard(shard):
+        return function(*args)
+
+def dialect_insert(model):
+    # SQLite and PostgreSQL share the ON CONFLICT upsert syntax
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_specific_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_specific_insert
+    return dialect_specific_insert(model)
+
+def resolve_dimensions(locations):
+    known = get_dimension_cache()['bays']
+    missing = {location for location in locations if location not in known}
+    if not missing:
+        return known
+
+    substation_names = {substation for substation, _ in missing}
+    db.session.execute(dialect_insert(Substation).on_conflict_do_nothing(index_elements=['name']),
+                       [{'name': name} for name in substation_names])
+    substation_ids = dict(db.session.execute(
+        select(Substation.name, Substation.id).filter(Substation.name.in_(substation_names))).all())
+    db.session.execute(
+        dialect_insert(Bay).on_conflict_do_nothing(index_elements=['substation_id', 'name']),
+        [{'substation_id': substation_ids[substation], 'name': bay} for substation, bay in missing])
+    bay_ids = {(substation_id, name): bay_id for substation_id, name, bay_id in db.session.execute(
+        select(Bay.substation_id, Bay.name, Bay.id).filter(Bay.substation_id.in_(substation_ids.values())))}
+    resolved = {(substation, bay): (substation_ids[substation], bay_ids[(substation_ids[substation], bay)])
+                for substation, bay in missing}
+
+    # New rows are still uncommitted here, so the cache is only told to reload
+    invalidate_dimension_cache()
+    return {**known, **resolved}
 
 def get_report_filters(form_data):
     return {
@@ -302,9 +1435,7 @@ def get_report_filters(form_data):
         'bay': form_data.get('bay')
     }
 
-def get_filtered_records(filters):
-    query = MeasurementRecord.query
-
+def apply_record_filters(query, filters):
     if filters['start_date']:
         start = datetime.strptime(filters['start_date'], '%Y-%m-%d')
         query = query.filter(MeasurementRecord.timestamp >= start)
@@ -312,182 +1443,1135 @@ def get_filtered_records(filters):
         end = datetime.strptime(filters['end_date'], '%Y-%m-%d') + timedelta(days=1)
         query = query.filter(MeasurementRecord.timestamp < end)
     if filters['substation']:
-        query = query.filter_by(substation_name=filters['substation'])
+        query = query.filter(MeasurementRecord.substation_name == filters['substation'])
     if filters['bay']:
-        query = query.filter_by(bay_name=filters['bay'])
+        query = query.filter(MeasurementRecord.bay_name == filters['bay'])
+    if filters.get('locations'):
+        query = query.filter(match_locations(MeasurementRecord, filters['locations']))
+
+    return query
+
+def load_report_data(filters, parameters=None, record_fields=()):
+    # A single join-free query straight into columns; report helpers work on
+    # these frames instead of ORM objects.
+    line_parameters = [parameter for parameter in LINE_PARAMETERS
+                       if parameters is None or parameter in parameters]
+    columns = ['id', 'timestamp', 'substation_name', 'bay_name', 'voltage_level', *record_fields,
+               *[LINE_VALUE_COLUMNS[parameter] for parameter in line_parameters]]
+    frame_columns = ['record_id', 'timestamp', 'substation', 'bay', 'voltage_level', *record_fields, *line_parameters]
+    record_stmt = apply_record_filters(select(*[MeasurementRecord.__table__.c[column] for column in columns]),
+                                       filters).order_by(MeasurementRecord.timestamp, MeasurementRecord.id)
+    frames = [load_archived_records(filters, columns)] + \
+        query_shards(get_filter_shards(filters), select_frame, record_stmt, columns)
+    records = concat_frames(frames)
+    if sum(not frame.empty for frame in frames) > 1:
+        records = records.sort_values(['timestamp', 'id'], kind='stable', ignore_index=True)
+    records.columns = frame_columns
+    for column in ['substation', 'bay', 'voltage_level']:
+        records[column] = records[column].astype('category')
+
+    measurements = records.melt(id_vars=['record_id', 'timestamp', 'substation', 'bay', 'voltage_level'],
+                                value_vars=line_parameters, var_name='parameter')
+    measurements = measurements.dropna(subset=['value']).astype({'value': float})
+    measurements['kind'] = measurements['parameter'].map(PARAMETER_KINDS).astype('category')
+    measurements['parameter'] = measurements['parameter'].astype('category')
 
-    return query.order_by(MeasurementRecord.timestamp).all()
-
-def generate_phase_report(records, measurement_type):
-    data = []
-    for record in records:
-        measurements = record.phase_currents if measurement_type == 'current' else record.phase_voltages
-        for m in measurements:
-            data.append({
-                'timestamp': record.timestamp,
-                'substation': record.substation_name,
-                'bay': record.bay_name,
-                'phase': m.phase,
-                'value': m.value
-            })
-
-    if not data:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(data)
-    return df.groupby(['substation', 'bay', 'phase']).agg({
-        'value': ['min', 'max', 'mean', 'std']
-    }).round(2)
-
-def generate_sequence_report(records):
-    data = []
-    for record in records:
-        for sc in record.sequence_components:
-            data.append({
-                'substation': record.substation_name,
-                'bay': record.bay_name,
-                'component': sc.component,
-                'value': sc.value
-            })
+    return {
+        'records': records.drop(columns=line_parameters),
+        'measurements': measurements[['record_id', 'timestamp', 'substation', 'bay',
+                                      'voltage_level', 'kind', 'parameter', 'value']]
+    }
 
-    if not data:
+def select_frame(stmt, columns):
+    return pd.DataFrame(db.session.execute(stmt).all(), columns=columns)
+
+def concat_frames(frames):
+    # Empty partials are left out so they cannot change the merged dtypes
+    non_empty = [frame for frame in frames if not frame.empty]
+    if len(non_empty) > 1:
+        return pd.concat(non_empty, ignore_index=True)
+    return non_empty[0] if non_empty else frames[-1]
+
+def get_filter_bounds(filters):
+    start = datetime.strptime(filters['start_date'], '%Y-%m-%d') if filters['start_date'] else None
+    end = datetime.strptime(filters['end_date'], '%Y-%m-%d') + timedelta(days=1) if filters['end_date'] else None
+    return start, end
+
+def get_rollup_ranges(filters):
+    # Report filters are whole days, so buckets line up exactly with the
+    # requested range and no raw rows are needed. Whole months come from month
+    # buckets, the days either side from day buckets, and an unfiltered
+    # period from the single all-time bucket.
+    start, end = get_filter_bounds(filters)
+    if start is None and end is None:
+        return [('all', None, None)]
+
+    first_month = None
+    if start is not None:
+        first_month = start if start.day == 1 else (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+    last_month = end.replace(day=1) if end is not None else None
+    if first_month and last_month and first_month >= last_month:
+        return [('day', start, end)]
+
+    ranges = [('month', first_month, last_month)]
+    if start is not None and start < first_month:
+        ranges.append(('day', start, first_month))
+    if end is not None and last_month < end:
+        ranges.append(('day', last_month, end))
+    return ranges
+
+def apply_rollup_filters(query, filters, ranges):
+    conditions = []
+    for granularity, start, end in ranges:
+        condition = MeasurementRollup.granularity == granularity
+        if start is not None:
+            condition = and_(condition, MeasurementRollup.bucket_start >= start)
+        if end is not None:
+            condition = and_(condition, MeasurementRollup.bucket_start < end)
+        conditions.append(condition)
+    query = query.filter(or_(*conditions))
+    if filters['substation']:
+        query = query.filter(MeasurementRollup.substation_name == filters['substation'])
+    if filters['bay']:
+        query = query.filter(MeasurementRollup.bay_name == filters['bay'])
+
+    return query
+
+def query_rollup_aggregates(filters, parameters):
+    # Returns the matching buckets as mergeable partials; summarize_aggregates
+    # combines them.
+    stmt = select(
+        MeasurementRollup.substation_name,
+        MeasurementRollup.bay_name,
+        MeasurementRollup.parameter,
+        MeasurementRollup.value_count,
+        MeasurementRollup.min_value,
+        MeasurementRollup.max_value,
+        MeasurementRollup.value_mean,
+        MeasurementRollup.value_m2
+    ).filter(MeasurementRollup.parameter.in_(parameters))
+    stmt = apply_rollup_filters(stmt, filters, get_rollup_ranges(filters))
+
+    return concat_frames(query_shards(get_filter_shards(filters), select_frame, stmt, AGGREGATE_COLUMNS))
+
+def merge_moments(partials, keys):
+    # Pairwise-free form of Chan et al.'s parallel update: pooled mean, then
+    # each partial's M2 plus its spread around the pooled mean.
+    grouped = partials.assign(weighted=partials['count'] * partials['mean']).groupby(keys, observed=True)
+    totals = grouped.agg(count=('count', 'sum'), min=('min', 'min'), max=('max', 'max'),
+                         weighted=('weighted', 'sum'))
+    totals['mean'] = totals['weighted'] / totals['count']
+    pooled_mean = partials.merge(totals[['mean']], left_on=keys, right_index=True, suffixes=('', '_total'))
+    spread = pooled_mean['m2'] + pooled_mean['count'] * (pooled_mean['mean'] - pooled_mean['mean_total']) ** 2
+    totals['m2'] = spread.groupby([pooled_mean[key] for key in keys], observed=True).sum()
+    return totals[['count', 'min', 'max', 'mean', 'm2']]
+
+def summarize_aggregates(partials, key_name):
+    if partials.empty:
         return pd.DataFrame()
 
-    df = pd.DataFrame(data)
-    return df.groupby(['substation', 'bay', 'component']).agg({
-        'value': ['min', 'max', 'mean', 'std']
-    }).round(2)
-
-def check_thresholds(records, thresholds):
+    totals = merge_moments(partials, ['substation', 'bay', 'key'])
+    # Sample variance (ddof=1) to match pandas' std of the raw values
+    variance = (totals['m2'] / (totals['count'] - 1)).where(totals['count'] > 1).clip(lower=0)
+
+    report = pd.DataFrame({
+        ('value', 'min'): totals['min'],
+        ('value', 'max'): totals['max'],
+        ('value', 'mean'): totals['mean'],
+        ('value', 'std'): variance ** 0.5
+    })
+    report.index.names = ['substation', 'bay', key_name]
+    return report.round(2)
+
+def generate_phase_report(filters, measurement_type):
+    parameters = PHASE_CURRENTS if measurement_type == 'current' else PHASE_VOLTAGES
+    return summarize_aggregates(query_rollup_aggregates(filters, parameters), 'phase')
+
+def generate_sequence_report(filters):
+    return summarize_aggregates(query_rollup_aggregates(filters, SEQUENCE_COMPONENTS), 'component')
+
+def get_threshold_limits():
+    with use_shard(None):
+        rows = db.session.execute(select(
+            ThresholdLimit.parameter,
+            ThresholdLimit.substation_name,
+            ThresholdLimit.voltage_level,
+            ThresholdLimit.bay_name,
+            ThresholdLimit.low_limit,
+            ThresholdLimit.high_limit
+        )).all()
+    limits = pd.DataFrame(rows, columns=['parameter', 'substation', 'voltage_level', 'bay',
+                                         'low_limit', 'high_limit']).astype({'low_limit': float, 'high_limit': float})
+
+    # Built-in high limits apply wherever no fleet-wide limit has been stored
+    global_scope = limits[['substation', 'voltage_level', 'bay']].isna().all(axis=1)
+    configured = set(limits.loc[global_scope, 'parameter'])
+    defaults = pd.DataFrame([{'parameter': parameter, 'high_limit': float(limit)}
+                             for parameter, limit in DEFAULT_THRESHOLDS.items()
+                             if parameter not in configured],
+                            columns=limits.columns)
+    if not defaults.empty:
+        limits = pd.concat([limits, defaults], ignore_index=True) if not limits.empty else defaults
+
+    return limits.sort_values('parameter', kind='stable').reset_index(drop=True)
+
+def resolve_threshold_limits(scopes, limits):
+    # Matches every distinct (substation, voltage level, bay) against every
+    # limit at once and keeps the most specific limit per parameter.
+    candidates = scopes.merge(limits.rename(columns={
+        'parameter': 'limit_key',
+        'substation': 'limit_substation',
+        'voltage_level': 'limit_voltage_level',
+        'bay': 'limit_bay'
+    }), how='cross')
+
+    specificity = pd.Series(0, index=candidates.index)
+    matches = pd.Series(True, index=candidates.index)
+    for column, weight in [('substation', 1), ('voltage_level', 2), ('bay', 4)]:
+        scoped = candidates[f'limit_{column}'].notna()
+        matches &= ~scoped | (candidates[f'limit_{column}'] == candidates[column])
+        specificity += scoped * weight
+
+    candidates = candidates[matches].assign(specificity=specificity[matches])
+    return candidates.sort_values('specificity', ascending=False, kind='stable') \
+        .drop_duplicates(['substation', 'voltage_level', 'bay', 'limit_key'])[
+            ['substation', 'voltage_level', 'bay', 'limit_key', 'low_limit', 'high_limit']]
+
+def check_thresholds(report_frame, limits):
+    alert_columns = ['timestamp', 'type', 'parameter', 'limit', 'value', 'threshold', 'substation', 'bay']
+    values = report_frame['measurements']
+    records = report_frame['records']
+    for kind, fields in [('transformer', TRANSFORMER_LIMIT_FIELDS), ('derived', DERIVED_FIELDS)]:
+        fields = [field for field in fields if field in records.columns]
+        if not fields:
+            continue
+        record_values = records.melt(
+            id_vars=['record_id', 'timestamp', 'substation', 'bay', 'voltage_level'],
+            value_vars=fields, var_name='parameter').dropna(subset=['value'])
+        record_values['kind'] = kind
+        values = pd.concat([values.astype({'kind': str, 'parameter': str}),
+                            record_values], ignore_index=True)
+
+    if values.empty or limits.empty:
+        return pd.DataFrame(columns=alert_columns)
+
+    values = values.astype({'substation': str, 'voltage_level': str, 'bay': str,
+                            'kind': str, 'parameter': str})
+    values['limit_key'] = values['parameter'].mask(values['kind'].isin(['current', 'voltage']),
+                                                   values['kind'])
+
+    scope_columns = ['substation', 'voltage_level', 'bay']
+    resolved = resolve_threshold_limits(values[scope_columns].drop_duplicates(), limits)
+    values = values.merge(resolved, on=scope_columns + ['limit_key'])
+
+    high = values['value'] > values['high_limit']
+    low = values['value'] < values['low_limit']
+    alerts = values[high | low].copy()
+    alerts['limit'] = 'High'
+    alerts.loc[low[high | low], 'limit'] = 'Low'
+    alerts['threshold'] = alerts['high_limit'].where(alerts['limit'] == 'High', alerts['low_limit'])
+    alerts['type'] = alerts['kind'].str.title()
+
+    return alerts.sort_values(['timestamp', 'record_id'], kind='stable')[alert_columns] \
+        .reset_index(drop=True)
+
+def get_anomaly_values(report_frame):
+    # One row per reading of every scored parameter, with the loading of the
+    # heating winding next to each transformer temperature
+    records = report_frame['records']
+    frames = [report_frame['measurements'][['timestamp', 'substation', 'bay', 'parameter', 'value']]
+              .astype({'substation': str, 'bay': str, 'parameter': str})]
+    for field, load_field in ANOMALY_LOAD_FIELDS.items():
+        if field not in records.columns:
+            continue
+        temperatures = records[['timestamp', 'substation', 'bay']].astype({'substation': str, 'bay': str}).assign(
+            parameter=field, value=pd.to_numeric(records[field], errors='coerce'),
+            load=pd.to_numeric(records[load_field], errors='coerce') if load_field in records.columns else np.nan)
+        frames.append(temperatures.dropna(subset=['value']))
+    return concat_frames(frames).reindex(columns=['timestamp', 'substation', 'bay', 'parameter', 'value', 'load'])
+
+def score_anomalies(values, states=None):
+    # Grouped exponentially weighted windows over every location and parameter
+    # at once. adjust=False makes them the plain recurrence m = (1 - a) m + a x,
+    # so a stored state placed in front of its group as a pseudo reading carries
+    # the averages on exactly as if the whole history were scored in one pass.
+    keys = ['substation', 'bay', 'parameter']
+    averaged = ['x', 'x2', 'noise2', 'rate', 'rate2', 'load', 'load2', 'cross']
+    frame = values.assign(seed=False, count=1, fast=values['value'], x=values['value'], x2=values['value'] ** 2,
+                          noise2=np.nan, rate=np.nan, rate2=np.nan, load2=values['load'] ** 2,
+                          cross=values['value'] * values['load'], measured_load=values['load'])
+    if states is not None and not states.empty:
+        seeds = states.rename(columns={
+            'reading_count': 'count', 'last_timestamp': 'timestamp', 'last_value': 'value', 'fast_mean': 'fast',
+            'value_mean': 'x', 'value_mean_sq': 'x2', 'noise_mean_sq': 'noise2', 'rate_mean': 'rate',
+            'rate_mean_sq': 'rate2', 'load_mean': 'load', 'load_mean_sq': 'load2', 'cross_mean': 'cross',
+        }).assign(seed=True)
+        frame = pd.concat([seeds, frame], ignore_index=True)
+    frame = frame.sort_values(keys + ['timestamp'], kind='stable', ignore_index=True)
+    frame[averaged + ['fast']] = frame[averaged + ['fast']].astype(float)
+    readings = ~frame['seed']
+
+    groups = frame.groupby(keys, sort=False).ngroup()
+    grouped = frame.groupby(groups, sort=False)
+    frame['seen'] = grouped['count'].cumsum() - frame['count']
+    hours = grouped['timestamp'].diff().dt.total_seconds() / 3600
+    rate = grouped['value'].diff() / hours.where(hours > 0)
+    frame.loc[readings, 'rate'] = rate
+    frame.loc[readings, 'rate2'] = rate ** 2
+
+    fast = frame['fast'].groupby(groups).ewm(span=ANOMALY_FAST_SPAN, adjust=False, ignore_na=True).mean()
+    frame['fast'] = fast.droplevel(0).sort_index()
+    # Noise is how far readings stray from the fast average. A slow creep is
+    # followed by that average, so unlike the spread of the readings
+    # themselves it does not grow with the drift it is meant to expose.
+    frame.loc[readings, 'noise2'] = (frame['value'] - frame['fast'].groupby(groups).shift()) ** 2
+    slow = frame[averaged].groupby(groups).ewm(span=ANOMALY_SLOW_SPAN, adjust=False, ignore_na=True).mean()
+    slow = slow.droplevel(0).sort_index()
+    prior = slow.groupby(groups).shift()
+
+    variance = (prior['x2'] - prior['x'] ** 2).clip(lower=0)
+    rate_variance = (prior['rate2'] - prior['rate'] ** 2).clip(lower=0)
+    # Temperature expected from the load through the baseline's regression line
+    load_variance = prior['load2'] - prior['load'] ** 2
+    covariance = prior['cross'] - prior['x'] * prior['load']
+    slope = covariance / load_variance.where(load_variance > 0)
+    thermal_expected = prior['x'] + slope * (frame['measured_load'] - prior['load'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = pd.DataFrame({
+            'drift_score': (frame['fast'] - prior['x']) / np.sqrt(prior['noise2']),
+            'rate_score': (frame['rate'] - prior['rate']) / np.sqrt(rate_variance),
+            'thermal_score': (frame['value'] - thermal_expected) /
+                             np.sqrt((variance - slope * covariance).clip(lower=0)),
+        }).replace([np.inf, -np.inf], np.nan)
+    scored = pd.concat([frame, scores], axis=1).assign(
+        drift_expected=prior['x'], rate_expected=prior['rate'], thermal_expected=thermal_expected)[readings]
+
+    latest = pd.concat([frame[keys + ['seen', 'count', 'timestamp', 'value', 'fast']], slow],
+                       axis=1)[readings].groupby(keys, sort=False).tail(1)
+    states = pd.DataFrame({
+        'substation': latest['substation'], 'bay': latest['bay'], 'parameter': latest['parameter'],
+        'reading_count': latest['seen'] + latest['count'], 'last_timestamp': latest['timestamp'],
+        'last_value': latest['value'], 'fast_mean': latest['fast'], 'value_mean': latest['x'],
+        'value_mean_sq': latest['x2'], 'noise_mean_sq': latest['noise2'], 'rate_mean': latest['rate'],
+        'rate_mean_sq': latest['rate2'], 'load_mean': latest['load'], 'load_mean_sq': latest['load2'],
+        'cross_mean': latest['cross'],
+    })
+    return scored, states.reset_index(drop=True)
+
+def find_anomalies(scored):
+    # Same columns as check_thresholds plus the score; value and threshold are
+    # the observed and expected level (per hour for rates of change)
+    alert_columns = ['timestamp', 'type', 'parameter', 'limit', 'value', 'threshold', 'substation', 'bay', 'score']
+    if scored.empty:
+        return pd.DataFrame(columns=alert_columns)
+    ready = scored['seen'] >= ANOMALY_MIN_READINGS
     alerts = []
-    for record in records:
-        for pc in record.phase_currents:
-            if pc.value > thresholds['current']:
-                alerts.append({
-                    'timestamp': record.timestamp,
-                    'type': 'Current',
-                    'phase': pc.phase,
-                    'value': pc.value,
-                    'threshold': thresholds['current'],
-                    'substation': record.substation_name,
-                    'bay': record.bay_name
-                })
-
-        for pv in record.phase_voltages:
-            if pv.value > thresholds['voltage']:
-                alerts.append({
-                    'timestamp': record.timestamp,
-                    'type': 'Voltage',
-                    'phase': pv.phase,
-                    'value': pv.value,
-                    'threshold': thresholds['voltage'],
-                    'substation': record.substation_name,
-                    'bay': record.bay_name
-                })
-
-        for sc in record.sequence_components:
-            if sc.component in thresholds and sc.value > thresholds[sc.component]:
-                alerts.append({
-                    'timestamp': record.timestamp,
-                    'type': 'Sequence',
-                    'component': sc.component,
-                    'value': sc.value,
-                    'threshold': thresholds[sc.component],
-                    'substation': record.substation_name,
-                    'bay': record.bay_name
-                })
-
-    return pd.DataFrame(alerts)
-
-def generate_trend_plot(filter_data, parameters):
-    records = get_filtered_records(filter_data)
-    if not records or not parameters:
+    for kind, score, value, expected, limit in [
+        ('Drift', 'drift_score', 'fast', 'drift_expected', ANOMALY_DRIFT_LIMIT),
+        ('Rate of change', 'rate_score', 'rate', 'rate_expected', ANOMALY_Z_LIMIT),
+        ('Thermal', 'thermal_score', 'value', 'thermal_expected', ANOMALY_Z_LIMIT),
+    ]:
+        flagged = scored[ready & (scored[score].abs() > limit)]
+        alerts.append(pd.DataFrame({
+            'timestamp': flagged['timestamp'], 'type': kind, 'parameter': flagged['parameter'],
+            'limit': np.where(flagged[score] > 0, 'High', 'Low'), 'value': flagged[value],
+            'threshold': flagged[expected].round(2), 'substation': flagged['substation'], 'bay': flagged['bay'],
+            'score': flagged[score].round(2)}, columns=alert_columns))
+    return pd.concat(alerts).sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+def detect_anomalies(report_frame):
+    values = get_anomaly_values(report_frame)
+    if values.empty:
+        return find_anomalies(values)
+    return find_anomalies(score_anomalies(values)[0])
+
+def update_anomaly_state(readings):
+    # Scores only the new readings, starting from the stored state of their
+    # locations, and stores the state at the last of them
+    values = get_anomaly_values(readings_to_report_frame(readings))
+    if values.empty:
+        return find_anomalies(values)
+    keys = ['substation', 'bay', 'parameter']
+    table = AnomalyState.__table__
+    rows = db.session.execute(select(table.c.substation_name, table.c.bay_name, table.c.parameter,
+                                     *[table.c[column] for column in ANOMALY_STATE_COLUMNS]).where(
+        table.c.substation_name.in_(set(values['substation'])), table.c.bay_name.in_(set(values['bay'])))).all()
+    states = pd.DataFrame(rows, columns=keys + ANOMALY_STATE_COLUMNS)
+    # Readings older than a state cannot be folded into it without rescoring
+    # the history after them; rebuild-anomaly-state takes them into account.
+    last_timestamps = pd.to_datetime(values.merge(states[keys + ['last_timestamp']], on=keys,
+                                                  how='left')['last_timestamp'])
+    values = values[~(values['timestamp'].to_numpy() <= last_timestamps.to_numpy())]
+    if values.empty:
+        return find_anomalies(values)
+    scored, states = score_anomalies(values, states)
+    store_anomaly_states(states)
+    return find_anomalies(scored)
+
+def store_anomaly_states(states):
+    stmt = dialect_insert(AnomalyState)
+    stmt = stmt.on_conflict_do_update(index_elements=['substation_name', 'bay_name', 'parameter'],
+                                      set_={column: stmt.excluded[column] for column in ANOMALY_STATE_COLUMNS})
+    rows = states.rename(columns={'substation': 'substation_name', 'bay': 'bay_name'}).astype(object)
+    db.session.execute(stmt, rows.where(rows.notna(), None).to_dict('records'))
+
+def get_transformer_days(filters):
+    # Reports read the stored days, which ingest keeps current, so a
+    # fleet-wide view costs one row per transformer and day.
+    stmt = apply_version_filters(select(TransformerDay.substation_name, TransformerDay.bay_name,
+                                        TransformerDay.bucket_start,
+                                        *[TransformerDay.__table__.c[column] for column in TRANSFORMER_DAY_COLUMNS]),
+                                 filters, TransformerDay)
+    return concat_frames(query_shards(get_filter_shards(filters), select_frame, stmt,
+                                      ['substation', 'bay', 'day'] + TRANSFORMER_DAY_COLUMNS))
+
+def find_stale_transformer_days(filters, shards=None):
+    # A day is stale when its data version has moved past the stored one.
+    # Transformers are the locations with an oil temperature rollup.
+    is_transformer = and_(MeasurementRollup.granularity == 'all', MeasurementRollup.parameter == 'oil_temp',
+                          MeasurementRollup.substation_name == DataVersion.substation_name,
+                          MeasurementRollup.bay_name == DataVersion.bay_name)
+    is_stored = and_(TransformerDay.substation_name == DataVersion.substation_name,
+                     TransformerDay.bay_name == DataVersion.bay_name,
+                     TransformerDay.bucket_start == DataVersion.bucket_start)
+    stmt = apply_version_filters(
+        select(DataVersion.substation_name, DataVersion.bay_name, DataVersion.bucket_start)
+        .join(MeasurementRollup, is_transformer).outerjoin(TransformerDay, is_stored)
+        .filter(or_(TransformerDay.data_version.is_(None), TransformerDay.data_version != DataVersion.version)),
+        filters)
+    return concat_frames(query_shards(shards or get_filter_shards(filters), select_frame, stmt,
+                                      ['substation', 'bay', 'day']))
+
+def update_transformer_days(readings):
+    # Runs in the ingest transaction of the current shard. Querying that one
+    # shard keeps refresh_transformer_days in this session, so it sees the
+    # readings just written. Only the batch's transformers are looked at, so
+    # the cost follows the batch rather than the fleet.
+    transformers = [record_data for record_data, _ in readings if record_data['element_type'] == 'transformer']
+    if transformers:
+        timestamps = [record_data['timestamp'] for record_data in transformers]
+        filters = get_report_filters({'start_date': f'{min(timestamps):%Y-%m-%d}',
+                                      'end_date': f'{max(timestamps):%Y-%m-%d}'})
+        locations = {(record_data['substation_name'], record_data['bay_name']) for record_data in transformers}
+        if len(locations) <= TRANSFORMER_REFRESH_MAX_LOCATIONS:
+            filters['locations'] = sorted(locations)
+        refresh_transformer_days(filters, [current_shard.get()])
+
+def refresh_transformer_days(filters, shards=None):
+    # Recomputes the stale days; the caller commits. The day after a stale day
+    # is redone too, because its first reading looks back at the last one of
+    # the stale day.
+    keys = ['substation', 'bay', 'day']
+    shards = shards or get_filter_shards(filters)
+    stale = find_stale_transformer_days(filters, shards)
+    if stale.empty:
+        return 0
+
+    first, last = stale['day'].min(), stale['day'].max() + timedelta(days=1)
+    version_filters = dict(filters, start_date=f'{first:%Y-%m-%d}', end_date=f'{last:%Y-%m-%d}')
+    stmt = apply_version_filters(select(DataVersion.substation_name, DataVersion.bay_name, DataVersion.bucket_start,
+                                        DataVersion.version), version_filters)
+    versions = concat_frames(query_shards(shards, select_frame, stmt, keys + ['version']))
+    targets = pd.concat([stale, stale.assign(day=stale['day'] + timedelta(days=1))]).drop_duplicates()
+    targets = targets.merge(versions, on=keys)
+
+    record_filters = dict(version_filters, start_date=f'{first - timedelta(days=1):%Y-%m-%d}')
+    days = compute_transformer_days(load_transformer_readings(record_filters, shards))
+    targets = targets.merge(days, on=keys, how='left')
+    # Days without transformer readings are stored too, so they are not stale again
+    targets = targets.fillna({'reading_count': 0, 'covered_hours': 0.0, 'aging_hours': 0.0, 'tap_operations': 0})
+    targets = targets.astype({'reading_count': int, 'tap_operations': int}).rename(columns={
+        'substation': 'substation_name', 'bay': 'bay_name', 'day': 'bucket_start', 'version': 'data_version'})
+    rows = targets.astype(object).where(targets.notna(), None).to_dict('records')
+    for shard, shard_rows in group_by_shard(rows, targets['substation_name']):
+        with use_shard(shard):
+            stmt = dialect_insert(TransformerDay)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['substation_name', 'bay_name', 'bucket_start'],
+                set_={column: stmt.excluded[column] for column in ['data_version'] + TRANSFORMER_DAY_COLUMNS})
+            db.session.execute(stmt, shard_rows)
+    return len(rows)
+
+def load_transformer_readings(filters, shards=None):
+    columns = ['timestamp', 'substation_name', 'bay_name', 'oil_temp', 'tap_position', *TRANSFORMER_LOADING_FIELDS]
+    record_stmt = apply_record_filters(select(*[MeasurementRecord.__table__.c[column] for column in columns])
+                                       .filter(MeasurementRecord.element_type == 'transformer'), filters)
+    archived = load_archived_records(filters, columns + ['element_type'])
+    archived = archived[archived['element_type'] == 'transformer'].drop(columns='element_type')
+    readings = concat_frames([archived] + query_shards(shards or get_filter_shards(filters), select_frame,
+                                                       record_stmt, columns))
+    readings.columns = ['timestamp', 'substation', 'bay', 'oil_temp', 'tap_position', *TRANSFORMER_LOADING_FIELDS]
+    numeric = ['oil_temp', 'tap_position', *TRANSFORMER_LOADING_FIELDS]
+    readings[numeric] = readings[numeric].astype(float)
+    readings['timestamp'] = pd.to_datetime(readings['timestamp']).astype('datetime64[ns]')
+    return readings
+
+def compute_transformer_days(readings):
+    # IEC 60076-7 hot spot from the measured top oil plus the gradient of the
+    # most loaded winding (per unit of its CT primary rating), for every
+    # reading at once. The winding time constant is shorter than the sampling
+    # interval, so the steady-state gradient is used. Each reading ages the
+    # insulation at its relative rate V = 2^((hot spot - 98) / 6) for the
+    # interval since the previous reading.
+    keys = ['substation', 'bay', 'day']
+    if readings.empty:
+        return pd.DataFrame(columns=keys + TRANSFORMER_DAY_COLUMNS)
+    readings = readings.sort_values(['substation', 'bay', 'timestamp'], kind='stable', ignore_index=True)
+    previous = readings.groupby(['substation', 'bay'], sort=False)[['timestamp', 'tap_position']].shift()
+    interval = readings['timestamp'] - previous['timestamp']
+    continued = interval <= TRANSFORMER_MAX_INTERVAL
+    loading = readings[TRANSFORMER_LOADING_FIELDS]
+    gradient = TRANSFORMER_HOT_SPOT_FACTOR * TRANSFORMER_WINDING_GRADIENT * loading ** TRANSFORMER_WINDING_EXPONENT
+    hot_spot = readings['oil_temp'] + gradient.max(axis=1)
+    hours = (interval.dt.total_seconds() / 3600).where(continued & hot_spot.notna(), 0.0)
+    aging_rate = 2 ** ((hot_spot - TRANSFORMER_REFERENCE_HOT_SPOT) / TRANSFORMER_AGING_DOUBLING)
+    frame = pd.DataFrame({
+        'substation': readings['substation'],
+        'bay': readings['bay'],
+        'day': readings['timestamp'].dt.normalize(),
+        'loading': loading.max(axis=1),
+        'oil_temp': readings['oil_temp'],
+        'hot_spot': hot_spot,
+        'hours': hours,
+        'aging': (aging_rate * hours).fillna(0.0),
+        # Sampling only sees the net movement between readings, so this is a lower bound
+        'taps': (readings['tap_position'] - previous['tap_position']).abs().where(continued, 0.0),
+    })
+    days = frame.groupby(keys, sort=False).agg(
+        reading_count=('hours', 'size'), covered_hours=('hours', 'sum'), max_loading=('loading', 'max'),
+        max_oil_temp=('oil_temp', 'max'), max_hot_spot=('hot_spot', 'max'), aging_hours=('aging', 'sum'),
+        tap_operations=('taps', 'sum'))
+    return days.reset_index()
+
+def summarize_transformer_days(days):
+    days = days[days['reading_count'] > 0]
+    if days.empty:
+        return pd.DataFrame()
+    grouped = days.groupby(['substation', 'bay'], sort=False)
+    summary = grouped.agg(first_day=('day', 'min'), last_day=('day', 'max'), days=('day', 'size'),
+                          readings=('reading_count', 'sum'), covered_hours=('covered_hours', 'sum'),
+                          max_loading=('max_loading', 'max'), max_oil_temp=('max_oil_temp', 'max'),
+                          max_hot_spot=('max_hot_spot', 'max'), aging_hours=('aging_hours', 'sum'),
+                          tap_operations=('tap_operations', 'sum'))
+    worst = days.loc[grouped['aging_hours'].idxmax()].set_index(['substation', 'bay'])
+    summary['worst_day'] = worst['day']
+    summary['worst_day_aging_hours'] = worst['aging_hours']
+    summary['aging_rate'] = (summary['aging_hours'] / summary['covered_hours']).where(summary['covered_hours'] > 0)
+    summary['loss_of_life'] = summary['aging_hours'] / TRANSFORMER_NORMAL_LIFE_HOURS * 100
+    summary['tap_operations_per_day'] = summary['tap_operations'] / summary['days']
+    return summary.sort_values('aging_hours', ascending=False).round(3)
+
+def get_data_version(filters):
+    # Sum of the version counters of every location day inside the filters;
+    # any write in that range raises it.
+    stmt = apply_version_filters(select(func.coalesce(func.sum(DataVersion.version), 0)), filters)
+    return sum(query_shards(get_filter_shards(filters), select_scalar, stmt))
+
+def get_transformer_day_version(filters):
+    # The data versions the stored transformer days were computed from; it
+    # rises when refresh-transformer-days brings stale days up to date
+    stmt = apply_version_filters(select(func.coalesce(func.sum(TransformerDay.data_version), 0)), filters,
+                                 TransformerDay)
+    return sum(query_shards(get_filter_shards(filters), select_scalar, stmt))
+
+def apply_version_filters(stmt, filters, model=DataVersion):
+    # For the tables keyed by location and day
+    start, end = get_filter_bounds(filters)
+    if start is not None:
+        stmt = stmt.filter(model.bucket_start >= start)
+    if end is not None:
+        stmt = stmt.filter(model.bucket_start < end)
+    if filters['substation']:
+        stmt = stmt.filter(model.substation_name == filters['substation'])
+    if filters['bay']:
+        stmt = stmt.filter(model.bay_name == filters['bay'])
+    if filters.get('locations'):
+        stmt = stmt.filter(match_locations(model, filters['locations']))
+    return stmt
+
+def match_locations(model, locations):
+    # One term per substation with its bays, so each is an index range on the location
+    bays = {}
+    for substation, bay in locations:
+        bays.setdefault(substation, []).append(bay)
+    return or_(*[and_(model.substation_name == substation, model.bay_name.in_(substation_bays))
+                 for substation, substation_bays in sorted(bays.items())])
+
+def select_scalar(stmt):
+    return db.session.execute(stmt).scalar()
+
+def select_row(stmt):
+    return tuple(db.session.execute(stmt).one())
+
+def bump_data_versions(readings):
+    bump_day_versions((record_data['substation_name'], record_data['bay_name'], record_data['timestamp'])
+                      for record_data, _ in readings)
+
+def bump_day_versions(locations):
+    # Creates the version of every (substation, bay, day) of the given
+    # timestamps at 1, or raises an existing one by one
+    rows = [{'substation_name': substation, 'bay_name': bay, 'bucket_start': day, 'version': 1}
+            for substation, bay, day in sorted({
+                (substation, bay, timestamp.replace(hour=0, minute=0, second=0, microsecond=0))
+                for substation, bay, timestamp in locations})]
+    if not rows:
+        return
+    stmt = dialect_insert(DataVersion)
+    stmt = stmt.on_conflict_do_update(index_elements=['substation_name', 'bay_name', 'bucket_start'],
+                                      set_={'version': DataVersion.version + 1})
+    db.session.execute(stmt, rows)
+
+def bump_frame_versions(frame):
+    # For the rebuild commands: bumps the days of a frame with substation,
+    # bay and timestamp columns, in the shard of each substation
+    days = frame[['substation', 'bay', 'timestamp']].assign(timestamp=frame['timestamp'].dt.normalize())
+    days = days.drop_duplicates()
+    locations = [(substation, bay, timestamp.to_pydatetime())
+                 for substation, bay, timestamp in days.itertuples(index=False)]
+    for shard, shard_locations in group_by_shard(locations, days['substation']):
+        with use_shard(shard):
+            bump_day_versions(shard_locations)
+
+def get_trend_plot(filters, parameters):
+    with timed_phase('load'):
+        granularity = choose_trend_granularity(filters)
+        if granularity:
+            report_frame = load_rollup_series(filters, parameters, granularity)
+        else:
+            report_frame = load_report_data(filters, parameters=parameters)
+    with timed_phase('plot'):
+        return generate_trend_plot(report_frame, parameters)
+
+class MemoryReportCache:
+    # Least recently used report contexts, pickled so callers never share
+    # mutable frames and the bound can be kept in bytes.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            self.size -= len(self.entries.pop(key, b''))
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.size -= len(self.entries.popitem(last=False)[1])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+class DiskReportCache:
+    # One pickle file per entry in a directory every worker can share. Hits
+    # touch the file, so evicting by modification time drops the least
+    # recently used entries first.
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f'{key}.pickle')
+
+    def __contains__(self, key):
+        return os.path.exists(self.get_path(key))
+
+    def get(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                data = cache_file.read()
+            os.utime(path)
+            return pickle.loads(data)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.get_path(key)
+        with open(f'{path}.{os.getpid()}.tmp', 'wb') as cache_file:
+            cache_file.write(data)
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pickle'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def create_report_cache(config):
+    backend = config['REPORT_CACHE']
+    if backend == 'memory':
+        return MemoryReportCache(config['REPORT_CACHE_MAX_BYTES'])
+    if backend == 'disk':
+        return DiskReportCache(config['REPORT_CACHE_DIR'], config['REPORT_CACHE_MAX_BYTES'])
+    if backend == 'none':
+        return MemoryReportCache(0)
+    raise ValueError(f"Unknown REPORT_CACHE backend: {backend}")
+
+def get_report_cache():
+    return current_app.extensions['report_cache']
+
+def choose_trend_granularity(filters):
+    # An open end of the span is found from the readings, archived ones included
+    start, end = get_filter_bounds(filters)
+    if start is None or end is None:
+        stmt = apply_record_filters(select(func.min(MeasurementRecord.timestamp),
+                                           func.max(MeasurementRecord.timestamp)), filters)
+        bounds = [row for row in query_shards(get_filter_shards(filters), select_row, stmt) if row[0] is not None]
+        archive_bounds = get_archive_bounds(filters)
+        if archive_bounds:
+            bounds.append(archive_bounds)
+        if not bounds:
+            return None
+        start, end = start or min(first for first, _ in bounds), end or max(last for _, last in bounds)
+
+    span_days = (end - start).total_seconds() / 86400
+    for limit, granularity in TREND_SPAN_LIMITS:
+        if span_days <= limit:
+            return granularity
+    return 'day'
+
+def load_rollup_series(filters, parameters, granularity):
+    # Bucket means across all matching bays, in the same shape as the
+    # measurements frame of load_report_data. Each shard returns sums and
+    # counts so the means can be combined.
+    stmt = select(
+        MeasurementRollup.bucket_start,
+        MeasurementRollup.parameter,
+        func.sum(MeasurementRollup.value_mean * MeasurementRollup.value_count),
+        func.sum(MeasurementRollup.value_count)
+    ).filter(MeasurementRollup.parameter.in_(parameters))
+    stmt = apply_rollup_filters(stmt, filters, [(granularity, *get_filter_bounds(filters))]) \
+        .group_by(MeasurementRollup.bucket_start, MeasurementRollup.parameter)
+
+    sums = concat_frames(query_shards(get_filter_shards(filters), select_frame, stmt,
+                                      ['timestamp', 'parameter', 'total', 'count'])) \
+        .groupby(['timestamp', 'parameter'], sort=True)[['total', 'count']].sum().reset_index()
+    return {'measurements': sums.assign(value=sums['total'] / sums['count'])[['timestamp', 'parameter', 'value']]}
+
+def downsample_lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the point in each bucket that forms
+    # the largest triangle with the previous pick and the next bucket's mean,
+    # which preserves peaks that plain decimation would drop.
+    length = len(x)
+    if threshold < 3 or length <= threshold:
+        return np.arange(length)
+
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, length - 1
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+
+    return selected
+
+def generate_trend_plot(report_frame, parameters):
+    measurements = report_frame['measurements']
+    if measurements.empty or not parameters:
         return None
 
-    plt.figure(figsize=(14, 8))
-    plt.style.use('ggplot')
-    colormap = plt.cm.get_cmap('tab20', len(parameters))
+    matplotlib = get_matplotlib()
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(14, 8))
+    axes = figure.subplots()
+    colormap = matplotlib.colormaps['tab20'].resampled(len(parameters))
 
     legend_handles = []
+    series = dict(tuple(measurements.groupby('parameter', observed=True)))
 
     for idx, param in enumerate(parameters):
-        timestamps = []
-        values = []
-
-        for record in records:
-            measurements = []
-            if param in ['I0', 'I1', 'I2', 'V0', 'V1', 'V2']:
-                measurements = [sc for sc in record.sequence_components if sc.component == param]
-            elif param.startswith('I'):
-                measurements = [pc for pc in record.phase_currents if pc.phase == param]
-            elif param.startswith('V'):
-                measurements = [pv for pv in record.phase_voltages if pv.phase == param]
-
-            for m in measurements:
-                timestamps.append(record.timestamp)
-                values.append(m.value)
-
-        if timestamps:
-            line, = plt.plot(timestamps, values,
-                           marker='o',
-                           linestyle='-',
-                           color=colormap(idx),
-                           label=param)
-            legend_handles.append(line)
+        points = series.get(param)
+        if points is None:
+            continue
+
+        timestamps = points['timestamp'].to_numpy()
+        values = points['value'].to_numpy(dtype=float)
+        keep = downsample_lttb(timestamps.astype('int64').astype(float), values, TREND_MAX_POINTS)
+        line, = axes.plot(timestamps[keep], values[keep],
+                          marker='o' if len(keep) <= TREND_MARKER_LIMIT else None,
+                          linestyle='-',
+                          color=colormap(idx),
+                          label=param)
+        legend_handles.append(line)
 
     if not legend_handles:
         return None
 
-    plt.title(f'Trend Analysis: {", ".join(parameters)}')
-    plt.xlabel('Timestamp')
-    plt.ylabel('Value')
-    plt.legend(handles=legend_handles, bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    axes.set_title(f'Trend Analysis: {", ".join(parameters)}')
+    axes.set_xlabel('Timestamp')
+    axes.set_ylabel('Value')
+    axes.legend(handles=legend_handles, bbox_to_anchor=(1.05, 1), loc='upper left')
+    axes.grid(True)
+    axes.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
 
     buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    plot_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-    plt.close()
+    figure.savefig(buf, format='png', bbox_inches='tight')
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+def iter_export_chunks(filters=None, record_ids=None):
+    # Records are read in id order a chunk at a time and flattened into one
+    # row per (record, parameter) so the exporters never hold the full result.
+    # Filtered exports start with the matching archived records.
+    columns = ['id', 'timestamp', 'substation_name', 'bay_name', 'voltage_level', 'element_type', 'winding_type',
+               'relay_type', *EXPORT_RECORD_FIELDS, *[LINE_VALUE_COLUMNS[parameter] for parameter in LINE_PARAMETERS]]
+    # Shards are read one after another; the shard is only selected around
+    # each query so nothing is routed while the generator is suspended.
+    if record_ids is None:
+        for records in iter_archived_records(filters, columns):
+            chunk = flatten_export_records(records)
+            if not chunk.empty:
+                yield chunk
+        shard_ids = {shard: None for shard in get_filter_shards(filters)}
+    else:
+        shard_ids = {}
+        for shard, record_id in map(parse_record_key, record_ids):
+            shard_ids.setdefault(shard, []).append(record_id)
+
+    for shard, ids in shard_ids.items():
+        last_id = 0
+        while True:
+            stmt = select(*[MeasurementRecord.__table__.c[column] for column in columns]) \
+                .filter(MeasurementRecord.id > last_id)
+            if ids is not None:
+                stmt = stmt.filter(MeasurementRecord.id.in_(ids))
+            else:
+                stmt = apply_record_filters(stmt, filters)
+            with use_shard(shard):
+                rows = db.session.execute(stmt.order_by(MeasurementRecord.id).limit(EXPORT_CHUNK_SIZE)).all()
+            if not rows:
+                break
+
+            records = pd.DataFrame(rows, columns=columns)
+            last_id = int(records['id'].iloc[-1])
+            chunk = flatten_export_records(records)
+            if not chunk.empty:
+                yield chunk
+
+def flatten_export_records(records):
+    records = records.set_axis(EXPORT_METADATA_COLUMNS + EXPORT_RECORD_FIELDS + LINE_PARAMETERS, axis=1)
+    for field in ['hv_ct_ratio', 'mv_ct_ratio', 'lv_ct_ratio', 'ct_ratio']:
+        records[field] = pd.to_numeric(records[field], errors='coerce')
+    chunk = records.melt(id_vars=EXPORT_METADATA_COLUMNS, value_vars=EXPORT_RECORD_FIELDS + LINE_PARAMETERS,
+                         var_name='parameter').dropna(subset=['value'])
+    return chunk.sort_values('record_id', kind='stable')[EXPORT_COLUMNS].astype({'value': float})
+
+def stream_csv_export(chunks):
+    yield ','.join(EXPORT_COLUMNS) + '\n'
+    for chunk in chunks:
+        yield chunk.to_csv(header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+
+class ExportStream(RawIOBase):
+    # Write-only sink that hands back whatever has been written since the last
+    # drain while still reporting the absolute position pyarrow needs.
+    def __init__(self):
+        super().__init__()
+        self.buffer = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+def stream_parquet_export(chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export requires the pyarrow package")
+
+    schema = pa.schema([
+        ('record_id', pa.int64()),
+        ('timestamp', pa.timestamp('us')),
+        ('substation', pa.string()),
+        ('bay', pa.string()),
+        ('voltage_level', pa.string()),
+        ('element_type', pa.string()),
+        ('winding_type', pa.string()),
+        ('relay_type', pa.string()),
+        ('parameter', pa.string()),
+        ('value', pa.float64())
+    ])
+
+    def generate():
+        sink = ExportStream()
+        with pq.ParquetWriter(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                yield sink.drain()
+        yield sink.drain()
+
+    return generate()
+
+def write_xlsx_export(chunks):
+    # constant_memory flushes each row to disk as soon as the next one starts,
+    # so worksheet size no longer depends on the number of records exported.
+    import xlsxwriter
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+    })
+    header_format = workbook.add_format({'bold': True})
+    worksheet, row = None, EXCEL_MAX_ROWS
+
+    for chunk in chunks:
+        for values in chunk.astype(object).to_numpy().tolist():
+            if row == EXCEL_MAX_ROWS:
+                worksheet = workbook.add_worksheet(f"Measurements {len(workbook.worksheets()) + 1}")
+                worksheet.write_row(0, 0, EXPORT_COLUMNS, header_format)
+                row = 1
+            worksheet.write_row(row, 0, values)
+            row += 1
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+def get_archive_path(path=''):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], path)
+
+def read_archive_manifest():
+    try:
+        with open(get_archive_path('manifest.json')) as manifest_file:
+            return json.load(manifest_file)['files']
+    except FileNotFoundError:
+        return []
+
+def write_archive_manifest(files):
+    path = get_archive_path('manifest.json')
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump({'files': sorted(files, key=lambda entry: (entry['first'], entry['substation']))},
+                  manifest_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+def select_archive_files(filters):
+    # The manifest's bounds rule out whole files before any of them is opened
+    start, end = get_filter_bounds(filters)
+    for entry in read_archive_manifest():
+        if filters['substation'] and entry['substation'] != filters['substation']:
+            continue
+        if filters['bay'] and filters['bay'] not in entry['bays']:
+            continue
+        if filters.get('locations') and not any(substation == entry['substation'] and bay in entry['bays']
+                                                for substation, bay in filters['locations']):
+            continue
+        if start is not None and datetime.fromisoformat(entry['last']) < start:
+            continue
+        if end is not None and datetime.fromisoformat(entry['first']) >= end:
+            continue
+        yield entry
+
+def iter_archived_records(filters, columns, entries=None):
+    # Only the requested columns are read, from memory-mapped files, and the
+    # filters are pushed down so row groups outside them are skipped.
+    entries = list(select_archive_files(filters)) if entries is None else entries
+    if not entries:
+        return
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Reading archived measurements requires the pyarrow package")
+
+    start, end = get_filter_bounds(filters)
+    row_filters = [condition for condition in [
+        ('timestamp', '>=', start) if start is not None else None,
+        ('timestamp', '<', end) if end is not None else None,
+        ('substation_name', '==', filters['substation']) if filters['substation'] else None,
+        ('bay_name', '==', filters['bay']) if filters['bay'] else None,
+        # The substations and bays of the locations, which can match a few other pairs too
+        ('substation_name', 'in', sorted({substation for substation, _ in filters['locations']}))
+        if filters.get('locations') else None,
+        ('bay_name', 'in', sorted({bay for _, bay in filters['locations']})) if filters.get('locations') else None,
+    ] if condition is not None]
+    for entry in entries:
+        table = pq.read_table(get_archive_path(entry['path']), columns=columns, filters=row_filters or None,
+                              memory_map=True)
+        for batch in table.to_batches(max_chunksize=EXPORT_CHUNK_SIZE):
+            yield batch.to_pandas()
+
+def load_archived_records(filters, columns):
+    frames = list(iter_archived_records(filters, columns))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+def get_archive_statistics(filters):
+    # Count, time bounds and locations of the archived readings in the same
+    # shape as select_statistics. Files that lie wholly inside the filters are
+    # answered from the manifest; only the others are read.
+    start, end = get_filter_bounds(filters)
+    partials, partial_entries = [], []
+    for entry in select_archive_files(filters):
+        first, last = datetime.fromisoformat(entry['first']), datetime.fromisoformat(entry['last'])
+        if (start is None or first >= start) and (end is None or last < end) and \
+                (not filters['bay'] or entry['bays'] == [filters['bay']]):
+            partials.append((entry['rows'], first, last, [(entry['substation'], bay) for bay in entry['bays']]))
+        else:
+            partial_entries.append(entry)
+    for records in iter_archived_records(filters, ['timestamp', 'substation_name', 'bay_name'], partial_entries):
+        if not records.empty:
+            partials.append((len(records), records['timestamp'].min().to_pydatetime(),
+                             records['timestamp'].max().to_pydatetime(),
+                             list(records[['substation_name', 'bay_name']].drop_duplicates().itertuples(index=False,
+                                                                                                      name=None))))
+    return partials
+
+def get_archive_bounds(filters):
+    # First and last archived reading inside the filters, from the manifest
+    entries = list(select_archive_files(filters))
+    if not entries:
+        return None
+    return (min(datetime.fromisoformat(entry['first']) for entry in entries),
+            max(datetime.fromisoformat(entry['last']) for entry in entries))
+
+def get_archive_schema():
+    import pyarrow as pa
+
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string(), datetime: pa.timestamp('us')}
+    return pa.schema([(column.name, types[column.type.python_type]) for column in MeasurementRecord.__table__.columns])
+
+def write_archive_file(substation, month, records):
+    # Readings that arrive late for an archived month are merged into its file
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = f"{quote(substation, safe='')}/{month:%Y-%m}.parquet"
+    full_path = get_archive_path(path)
+    if os.path.exists(full_path):
+        records = pd.concat([pq.read_table(full_path).to_pandas(), records], ignore_index=True) \
+            .drop_duplicates('id', keep='last')
+    records = records.sort_values(['timestamp', 'id'], kind='stable')
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(records, schema=get_archive_schema(), preserve_index=False),
+                   full_path + '.tmp', row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+    os.replace(full_path + '.tmp', full_path)
+    return {
+        'path': path,
+        'substation': substation,
+        'bays': sorted(records['bay_name'].unique().tolist()),
+        'first': records['timestamp'].min().isoformat(),
+        'last': records['timestamp'].max().isoformat(),
+        'rows': len(records)
+    }
+
+def query_value_stats(filters, parameters):
+    stmt = select(
+        func.max(MeasurementRollup.max_value),
+        func.min(MeasurementRollup.min_value),
+        func.sum(MeasurementRollup.value_mean * MeasurementRollup.value_count),
+        func.sum(MeasurementRollup.value_count)
+    ).filter(MeasurementRollup.parameter.in_(parameters))
+    stmt = apply_rollup_filters(stmt, filters, get_rollup_ranges(filters))
+    partials = [row for row in query_shards(get_filter_shards(filters), select_row, stmt) if row[3]]
+    maximum = max((row[0] for row in partials), default=None)
+    minimum = min((row[1] for row in partials), default=None)
+    total, count = sum(row[2] for row in partials), sum(row[3] for row in partials)
+
+    return {
+        'max': round(maximum, 2) if maximum is not None else 0,
+        'min': round(minimum, 2) if minimum is not None else 0,
+        'avg': round(total / count, 2) if count else 0
+    }
 
-    return plot_url
+def generate_summary_statistics(filters):
+    # Archived readings are counted with the database's. A substation can have
+    # readings in both and bay names repeat across substations, so both are
+    # counted from the merged locations.
+    stmt = apply_record_filters(select(
+        func.count(MeasurementRecord.id),
+        func.min(MeasurementRecord.timestamp),
+        func.max(MeasurementRecord.timestamp)
+    ), filters)
+    location_stmt = apply_record_filters(select(MeasurementRecord.substation_name,
+                                                MeasurementRecord.bay_name).distinct(), filters)
+    partials = [row for row in query_shards(get_filter_shards(filters), select_statistics, stmt, location_stmt)
+                if row[0]] + get_archive_statistics(filters)
+    locations = set(chain.from_iterable(row[3] for row in partials))
+    total_records = sum(row[0] for row in partials)
+    substations = len({substation for substation, _ in locations})
+    bays = len({bay for _, bay in locations})
+    first = min((row[1] for row in partials), default=None)
+    last = max((row[2] for row in partials), default=None)
 
-def generate_summary_statistics(records):
     stats = {
-        'total_records': len(records),
-        'substations': len({r.substation_name for r in records}),
-        'bays': len({r.bay_name for r in records}),
+        'total_records': total_records,
+        'substations': substations,
+        'bays': bays,
         'time_range': None,
         'current_stats': None,
         'voltage_stats': None
     }
 
-    if records:
-        timestamps = [r.timestamp for r in records]
+    if total_records:
         stats['time_range'] = {
-            'start': min(timestamps).strftime('%Y-%m-%d'),
-            'end': max(timestamps).strftime('%Y-%m-%d')
-        }
-
-        current_values = [pc.value for r in records for pc in r.phase_currents]
-        voltage_values = [pv.value for r in records for pv in r.phase_voltages]
-
-        stats['current_stats'] = {
-            'max': round(max(current_values), 2) if current_values else 0,
-            'min': round(min(current_values), 2) if current_values else 0,
-            'avg': round(sum(current_values)/len(current_values), 2) if current_values else 0
-        }
-
-        stats['voltage_stats'] = {
-            'max': round(max(voltage_values), 2) if voltage_values else 0,
-            'min': round(min(voltage_values), 2) if voltage_values else 0,
-            'avg': round(sum(voltage_values)/len(voltage_values), 2) if voltage_values else 0
+            'start': first.strftime('%Y-%m-%d'),
+            'end': last.strftime('%Y-%m-%d')
         }
+        stats['current_stats'] = query_value_stats(filters, PHASE_CURRENTS)
+        stats['voltage_stats'] = query_value_stats(filters, PHASE_VOLTAGES)
 
     return stats
 
+def select_statistics(stmt, location_stmt):
+    return (*db.session.execute(stmt).one(), [tuple(row) for row in db.session.execute(location_stmt)])
+
 def process_transformer_data(form_data):
     try:
         transformer_data = {
@@ -564,7 +2648,8 @@ def process_line_data(form_data):
             'hv_winding_temp': None, 'mv_winding_temp': None, 'lv_winding_temp': None,
             'active_power': float(form_data['active_power']) if form_data.get('active_power') else None,
             'reactive_power': float(form_data['reactive_power']) if form_data.get('reactive_power') else None,
-            'ct_ratio': float(form_data['ct_ratio']) if form_data.get('ct_ratio') else None
+            'ct_ratio': float(form_data['ct_ratio']) if form_data.get('ct_ratio') else None,
+            **{field: float(form_data[field]) if form_data.get(field) else None for field in PHASE_ANGLE_FIELDS}
         }
 
         # Validate required fields
@@ -580,49 +2665,1036 @@ def process_line_data(form_data):
     except Exception as e:
         raise ValueError(f"Error processing line data: {str(e)}")
 
-def process_phase_measurements(record_id, form_data):
+def process_phase_measurements(form_data):
     try:
         # Validate line-specific fields
-        for phase in ['IA', 'IB', 'IC', 'IN']:
+        for phase in PHASE_CURRENTS:
             if not form_data.get(f'{phase}_value'):
                 raise ValueError(f"Missing required field for phase current: {phase}")
-        for phase in ['VA', 'VB', 'VC', 'VN']:
+        for phase in PHASE_VOLTAGES:
             if not form_data.get(f'{phase}_value'):
                 raise ValueError(f"Missing required field for phase voltage: {phase}")
-        for comp in ['I0', 'I1', 'I2', 'V0', 'V1', 'V2']:
-            if not form_data.get(f'{comp}_value'):
+        # Sequence components may be left out when all three phase angles are
+        # given; derive_quantities then computes them from the phasors.
+        for comp in SEQUENCE_COMPONENTS:
+            angles = [f'{comp[0]}{phase}_angle' for phase in 'ABC']
+            if not form_data.get(f'{comp}_value') and not all(form_data.get(angle) for angle in angles):
                 raise ValueError(f"Missing required field for sequence component: {comp}")
 
-        # Phase Currents
-        for phase in ['IA', 'IB', 'IC', 'IN']:
-            db.session.add(PhaseCurrent(
-                record_id=record_id,
-                phase=phase,
-                value=float(form_data[f'{phase}_value'])
-            ))
+        return {parameter: float(form_data[f'{parameter}_value'])
+                for parameter in LINE_PARAMETERS if form_data.get(f'{parameter}_value')}
+    except Exception as e:
+        raise ValueError(f"Phase measurement error: {str(e)}")
 
-        # Phase Voltages
-        for phase in ['VA', 'VB', 'VC', 'VN']:
-            db.session.add(PhaseVoltage(
-                record_id=record_id,
-                phase=phase,
-                value=float(form_data[f'{phase}_value'])
-            ))
+def parse_timestamp(value):
+    if not value:
+        return datetime.utcnow()
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def validate_measurement(form_data):
+    # Validate common fields
+    required_common_fields = ['element_type', 'substation_name', 'bay_name', 'voltage_level', 'relay_type']
+    for field in required_common_fields:
+        if not form_data.get(field):
+            raise ValueError(f"Missing required field: {field}")
+
+    record_data = {
+        'timestamp': parse_timestamp(form_data.get('timestamp')),
+        'element_type': form_data['element_type'],
+        'substation_name': form_data['substation_name'],
+        'bay_name': form_data['bay_name'],
+        'voltage_level': form_data['voltage_level'],
+        'relay_type': form_data['relay_type']
+    }
+    phase_values = {}
+
+    if record_data['element_type'] == 'transformer':
+        if not form_data.get('winding_type'):
+            raise ValueError("Missing required field: winding_type")
+        record_data.update(process_transformer_data(form_data))
+    else:
+        record_data.update(process_line_data(form_data))
+        phase_values = process_phase_measurements(form_data)
+
+    return record_data, phase_values
+
+def parse_ct_ratio(values):
+    # CT ratios are stored as text ("800" or "800/1"); the primary rating is what loading is measured against
+    return pd.to_numeric(values.astype(str).str.split('/').str[0], errors='coerce').to_numpy(float)
+
+def phase_unbalance(values):
+    # Largest deviation from the phase average, as a percentage of the average (NEMA definition)
+    average = values.mean(axis=1)
+    deviation = np.abs(values - average[:, None]).max(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(average > 0, deviation / average * 100, np.nan)
+
+def fortescue(magnitudes, angles):
+    # Zero, positive and negative sequence magnitudes from phase magnitudes and angles in degrees
+    a = np.exp(2j * np.pi / 3)
+    transform = np.array([[1, 1, 1], [1, a, a ** 2], [1, a ** 2, a]]) / 3
+    return np.abs((magnitudes * np.exp(1j * np.deg2rad(angles))) @ transform.T)
+
+def derive_quantities(frame):
+    # Every quantity is a column-wise NumPy expression over the whole frame, so
+    # a batch costs the same number of operations as a single reading. Missing
+    # inputs give NaN rather than an error.
+    def column(name):
+        if name not in frame:
+            return np.full(len(frame), np.nan)
+        return pd.to_numeric(frame[name], errors='coerce').to_numpy(float)
+
+    derived = {}
+    for prefix, currents, active, reactive, ct_ratio in [
+        ('', ['phase_ia', 'phase_ib', 'phase_ic'], 'active_power', 'reactive_power', 'ct_ratio'),
+        *[(f'{winding}_', [f'{winding}_ia', f'{winding}_ib', f'{winding}_ic'], f'{winding}_active_power',
+           f'{winding}_reactive_power', f'{winding}_ct_ratio') for winding in ['hv', 'mv', 'lv']]
+    ]:
+        active_power, reactive_power = column(active), column(reactive)
+        apparent_power = np.hypot(active_power, reactive_power)
+        phase_currents = np.column_stack([column(current) for current in currents])
+        rating = parse_ct_ratio(frame[ct_ratio]) if ct_ratio in frame else np.full(len(frame), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            derived[f'{prefix}apparent_power'] = apparent_power
+            derived[f'{prefix}power_factor'] = np.where(apparent_power > 0, active_power / apparent_power, np.nan)
+            derived[f'{prefix}loading'] = np.where(rating > 0, phase_currents.max(axis=1) / rating, np.nan)
+        derived[f'{prefix}current_unbalance'] = phase_unbalance(phase_currents)
+    derived['voltage_unbalance'] = phase_unbalance(
+        np.column_stack([column(voltage) for voltage in ['phase_va', 'phase_vb', 'phase_vc']]))
+
+    for quantity, phases in [('I', ['IA', 'IB', 'IC']), ('V', ['VA', 'VB', 'VC'])]:
+        magnitudes = np.column_stack([column(LINE_VALUE_COLUMNS[phase]) for phase in phases])
+        angles = np.column_stack([column(f'{phase}_angle') for phase in phases])
+        components = fortescue(np.nan_to_num(magnitudes), np.nan_to_num(angles))
+        supplied = ~np.isnan(magnitudes).any(axis=1) & ~np.isnan(angles).any(axis=1)
+        for index, order in enumerate('012'):
+            derived[f'{quantity}{order}'] = np.where(supplied, components[:, index], np.nan)
+
+    return pd.DataFrame(derived, index=frame.index)
+
+def apply_derived_quantities(readings):
+    # Derived values are added to the readings in place so they are stored
+    # and exported like measured ones.
+    if not readings:
+        return
+    frame = pd.DataFrame([{**record_data, **{LINE_VALUE_COLUMNS[parameter]: value
+                                             for parameter, value in phase_values.items()}}
+                          for record_data, phase_values in readings])
+    derived = derive_quantities(frame)
+    for (record_data, phase_values), values in zip(readings, derived.to_dict('records')):
+        for field, value in values.items():
+            if np.isnan(value):
+                continue
+            if field in SEQUENCE_COMPONENTS:
+                phase_values[field] = float(value)
+            else:
+                record_data[field] = float(value)
+
+def store_measurements(readings):
+    # Readings are written to the shard of their substation. The caller owns
+    # the transaction, which covers every shard written to; the shards commit
+    # one after another, not atomically.
+    apply_derived_quantities(readings)
+    record_keys, stored_readings, anomalies = [], [], []
+    for shard, shard_readings in group_by_shard(readings, [record_data['substation_name']
+                                                           for record_data, _ in readings]):
+        with use_shard(shard):
+            record_ids = insert_records(shard_readings)
+            update_rollups(readings_to_frame(shard_readings))
+            bump_data_versions(shard_readings)
+            update_transformer_days(shard_readings)
+            anomalies.append(update_anomaly_state(shard_readings))
+        record_keys.extend(format_record_key(shard, record_id) for record_id in record_ids)
+        stored_readings.extend(shard_readings)
+
+    if measurement_stream.has_clients():
+        # Built inside the transaction, published by the after_commit hook
+        db.session.info.setdefault('stream_events', []).extend(
+            build_stream_events(stored_readings, record_keys, anomalies))
+    return record_keys
+
+def insert_records(readings):
+    # One executemany INSERT ... RETURNING for the whole batch
+    record_columns = [column.name for column in MeasurementRecord.__table__.columns if column.name != 'id']
+    dimensions = resolve_dimensions({(record_data['substation_name'], record_data['bay_name'])
+                                     for record_data, _ in readings})
+    record_rows = []
+    for record_data, phase_values in readings:
+        substation_id, bay_id = dimensions[(record_data['substation_name'], record_data['bay_name'])]
+        row = {column: record_data.get(column) for column in record_columns}
+        row.update(substation_id=substation_id, bay_id=bay_id)
+        row.update({LINE_VALUE_COLUMNS[parameter]: value for parameter, value in phase_values.items()})
+        record_rows.append(row)
+    return db.session.execute(
+        insert(MeasurementRecord).returning(MeasurementRecord.id, sort_by_parameter_order=True),
+        record_rows
+    ).scalars().all()
+
+def build_stream_events(readings, record_keys, anomalies):
+    events = []
+    for record_key, (record_data, phase_values) in zip(record_keys, readings):
+        values = {field: record_data[field] for field in RECORD_VALUE_FIELDS if record_data.get(field) is not None}
+        values.update(phase_values)
+        events.append((record_data['substation_name'], record_data['bay_name'], format_stream_event('measurement', {
+            'id': record_key,
+            'timestamp': record_data['timestamp'].isoformat(timespec='seconds'),
+            'substation_name': record_data['substation_name'],
+            'bay_name': record_data['bay_name'],
+            'voltage_level': record_data['voltage_level'],
+            'element_type': record_data['element_type'],
+            'relay_type': record_data['relay_type'],
+            'values': values
+        }, record_key)))
+
+    alerts = check_thresholds(readings_to_report_frame(readings), get_threshold_limits())
+    for kind, frame in [('alert', alerts)] + [('anomaly', frame) for frame in anomalies]:
+        for alert in frame.to_dict('records'):
+            alert['timestamp'] = alert['timestamp'].isoformat(timespec='seconds')
+            events.append((alert['substation'], alert['bay'], format_stream_event(kind, alert)))
+    return events
+
+def format_stream_event(kind, payload, event_id=None):
+    data = json.dumps(payload, separators=(',', ':'))
+    return (f'id: {event_id}\n' if event_id is not None else '') + f'event: {kind}\ndata: {data}\n\n'
+
+def readings_to_report_frame(readings):
+    # The same frames load_report_data returns, so check_thresholds can run on
+    # a batch before it is committed. Positions stand in for the record ids,
+    # which are not comparable across shards.
+    location_columns = ['record_id', 'timestamp', 'substation', 'bay', 'voltage_level']
+    records, measurements = [], []
+    for position, (record_data, phase_values) in enumerate(readings):
+        location = (position, record_data['timestamp'], record_data['substation_name'],
+                    record_data['bay_name'], record_data['voltage_level'])
+        records.append(location + tuple(record_data.get(field) for field in RECORD_LIMIT_FIELDS))
+        measurements.extend(location + (PARAMETER_KINDS[parameter], parameter, value)
+                            for parameter, value in phase_values.items())
 
-        # Sequence Components
-        for comp in ['I0', 'I1', 'I2', 'V0', 'V1', 'V2']:
-            db.session.add(SequenceComponent(
-                record_id=record_id,
-                component=comp,
-                value=float(form_data[f'{comp}_value'])
-            ))
+    return {
+        'records': pd.DataFrame(records, columns=location_columns + RECORD_LIMIT_FIELDS)
+            .astype({field: float for field in RECORD_LIMIT_FIELDS}),
+        'measurements': pd.DataFrame(measurements, columns=location_columns + ['kind', 'parameter', 'value'])
+    }
+
+def readings_to_frame(readings):
+    rows = []
+    for record_data, phase_values in readings:
+        location = (record_data['timestamp'], record_data['substation_name'], record_data['bay_name'])
+        rows.extend(location + (field, record_data[field]) for field in MEASURED_RECORD_FIELDS
+                    if record_data.get(field) is not None)
+        rows.extend(location + item for item in phase_values.items())
+
+    return pd.DataFrame(rows, columns=['timestamp', 'substation', 'bay', 'parameter', 'value'])
+
+def get_bucket_starts(timestamps, granularity):
+    frequency = ROLLUP_GRANULARITIES[granularity]
+    if frequency is None:
+        return pd.Series(ROLLUP_ALL_TIME_START, index=timestamps.index)
+    if frequency == 'MS':
+        return timestamps.dt.to_period('M').dt.start_time
+    return timestamps.dt.floor(frequency)
+
+def compute_rollups(values, granularities=ROLLUP_GRANULARITIES):
+    # Per-bucket count, min, max, mean and M2 of a batch of long-form values
+    rollups = []
+    for granularity in granularities:
+        keys = ['bucket_start', 'substation', 'bay', 'parameter']
+        buckets = values.assign(bucket_start=get_bucket_starts(values['timestamp'], granularity))
+        grouped = buckets.groupby(keys, observed=True)['value']
+        deviation = (buckets['value'] - grouped.transform('mean')) ** 2
+        partials = grouped.agg(['count', 'min', 'max', 'mean'])
+        partials['m2'] = deviation.groupby([buckets[key] for key in keys], observed=True).sum()
+        rollups.append(partials.reset_index().assign(granularity=granularity))
+    return pd.concat(rollups, ignore_index=True)
+
+def update_rollups(values):
+    if values.empty:
+        return
+
+    rollups = compute_rollups(values).rename(columns={
+        'substation': 'substation_name', 'bay': 'bay_name', 'count': 'value_count', 'min': 'min_value',
+        'max': 'max_value', 'mean': 'value_mean', 'm2': 'value_m2'})
+    for shard, rows in group_by_shard(rollups.to_dict('records'), rollups['substation_name']):
+        with use_shard(shard):
+            upsert_rollups(rows)
+
+def upsert_rollups(rows):
+    # Merges each batch's partials into the stored accumulators in one
+    # statement, with Chan et al.'s pairwise update for mean and M2.
+    if db.session.get_bind().dialect.name == 'postgresql':
+        lesser, greater = func.least, func.greatest
+    else:
+        lesser, greater = func.min, func.max
+
+    stmt = dialect_insert(MeasurementRollup)
+    count = MeasurementRollup.value_count + stmt.excluded.value_count
+    delta = stmt.excluded.value_mean - MeasurementRollup.value_mean
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['granularity', 'bucket_start', 'substation_name', 'bay_name', 'parameter'],
+        set_={
+            'value_count': count,
+            'min_value': lesser(MeasurementRollup.min_value, stmt.excluded.min_value),
+            'max_value': greater(MeasurementRollup.max_value, stmt.excluded.max_value),
+            'value_mean': MeasurementRollup.value_mean + delta * stmt.excluded.value_count / count,
+            'value_m2': MeasurementRollup.value_m2 + stmt.excluded.value_m2 +
+                        delta * delta * MeasurementRollup.value_count * stmt.excluded.value_count / count
+        })
+    db.session.execute(stmt, rows)
+
+def normalize_ingest_row(row):
+    # JSON numbers are turned back into form-style strings so a reading of 0
+    # passes the same "is the field filled in" checks as the HTML form.
+    if not isinstance(row, dict):
+        raise ValueError("Measurement must be an object")
+    return {key: '' if value is None else str(value) for key, value in row.items()}
+
+def validate_ingest_rows(rows, first_row=1):
+    readings, errors = [], []
+    for number, row in enumerate(rows, start=first_row):
+        try:
+            readings.append(validate_measurement(normalize_ingest_row(row)))
+        except ValueError as ve:
+            errors.append({'row': number, 'error': str(ve)})
+    return readings, errors
 
+def ingest_measurements(rows, first_row=1):
+    readings, errors = validate_ingest_rows(rows, first_row)
+    if readings:
+        try:
+            store_measurements(readings)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return len(readings), errors
+
+class IngestWriter:
+    # Write-behind queue for validated readings. A daemon thread commits them in
+    # batches once WRITE_BEHIND_BATCH_SIZE readings are waiting or the oldest has
+    # waited WRITE_BEHIND_FLUSH_SECONDS, and drains the queue on shutdown.
+    def __init__(self, batch_size=WRITE_BEHIND_BATCH_SIZE, flush_seconds=WRITE_BEHIND_FLUSH_SECONDS,
+                 max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(max_pending)
+        self.stopping = threading.Event()
+        self.thread = None
+        self.app = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        atexit.register(self.stop)
+
+    def submit(self, readings):
+        # Started on first use so forking servers get a writer per worker
+        self.app = current_app._get_current_object()
+        self.start()
+        for reading in readings:
+            self.queue.put(reading)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.run, name='ingest-writer', daemon=True)
+                self.thread.start()
+
+    def flush(self):
+        self.queue.join()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def run(self):
+        while not self.stopping.is_set() or not self.queue.empty():
+            batch = self.next_batch()
+            if batch:
+                self.write(batch)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = 0 if self.stopping.is_set() else max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def write(self, batch):
+        # A batch the database keeps refusing is dropped whole. Any other error
+        # is down to some of its readings, so the batch is written again one
+        # reading at a time and only the readings that fail are dropped.
+        with self.app.app_context():
+            try:
+                self.store(batch)
+            except OperationalError as e:
+                self.drop(batch, e)
+            except Exception as e:
+                current_app.logger.warning(f"Queued ingest of {len(batch)} measurements failed, "
+                                           f"writing them one at a time: {str(e)}")
+                for reading in batch:
+                    try:
+                        self.store([reading])
+                    except Exception as e:
+                        self.drop([reading], e)
+
+    def store(self, readings):
+        # Retries while the database is locked or unavailable
+        for attempt in range(WRITE_BEHIND_RETRIES):
+            try:
+                store_measurements(readings)
+                db.session.commit()
+                return
+            except OperationalError as e:
+                db.session.rollback()
+                if attempt == WRITE_BEHIND_RETRIES - 1:
+                    raise
+                current_app.logger.warning(f"Queued ingest attempt {attempt + 1} failed: {str(e)}")
+                time.sleep(0.1 * 2 ** attempt)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def drop(self, readings, error):
+        # Logged in full so the readings can be replayed
+        self.dropped += len(readings)
+        current_app.logger.error(f"Dropped {len(readings)} queued measurements: {str(error)}", exc_info=error)
+        for record_data, phase_values in readings:
+            current_app.logger.error(f"Dropped measurement: {json.dumps([record_data, phase_values], default=str)}")
+
+ingest_writer = IngestWriter()
+
+class MeasurementStream:
+    # Fans committed readings and threshold alerts out to Server-Sent Events
+    # clients. Each client gets a bounded queue; one that falls behind is told
+    # so and disconnected rather than buffered without limit, and its browser
+    # reconnects and reloads the listing. Events only reach the clients of the
+    # process that committed the readings; under several gunicorn workers the
+    # stream is a preview of that worker's writes (see gunicorn.conf.py).
+    def __init__(self, buffer_size=STREAM_CLIENT_BUFFER):
+        self.buffer_size = buffer_size
+        self.clients = []
+        self.lock = threading.Lock()
+
+    def has_clients(self):
+        return bool(self.clients)
+
+    def client_count(self):
+        return len(self.clients)
+
+    def publish(self, events):
+        with self.lock:
+            clients = list(self.clients)
+        for filters, events_queue, dropped in clients:
+            for substation, bay, message in events:
+                if dropped.is_set():
+                    break
+                if (filters['substation'] and substation != filters['substation']) or \
+                        (filters['bay'] and bay != filters['bay']):
+                    continue
+                try:
+                    events_queue.put_nowait(message)
+                except queue.Full:
+                    dropped.set()
+
+    def listen(self, filters, max_clients):
+        # Registered on the first read, so a response that is never sent
+        # leaves nothing behind. The route turns clients away once the limit
+        # is reached; one that got past it at the same time is told to retry.
+        client = (filters, queue.Queue(self.buffer_size), threading.Event())
+        with self.lock:
+            full = len(self.clients) >= max_clients
+            if not full:
+                self.clients.append(client)
+        if full:
+            yield format_stream_event('busy', {'retry_after': STREAM_RETRY_SECONDS})
+            return
+        try:
+            yield f'retry: {STREAM_HEARTBEAT_SECONDS * 1000}\n\n'
+            while not client[2].is_set():
+                try:
+                    yield client[1].get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+            yield format_stream_event('overflow', {})
+        finally:
+            with self.lock:
+                self.clients.remove(client)
+
+measurement_stream = MeasurementStream()
+
+@event.listens_for(Session, 'after_commit')
+def publish_stream_events(session):
+    events = session.info.pop('stream_events', None)
+    if events:
+        measurement_stream.publish(events)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_stream_events(session):
+    session.info.pop('stream_events', None)
+
+@bp.cli.command('ingest')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=INGEST_BATCH_SIZE, show_default=True,
+              help='Measurements committed per transaction.')
+def ingest_command(path, batch_size):
+    """Load measurements from a CSV or JSON file at PATH."""
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        if path.lower().endswith('.json'):
+            rows = json.load(source)
+            rows = rows.get('measurements', []) if isinstance(rows, dict) else rows
+        else:
+            rows = csv.DictReader(source)
+
+        total_inserted, total_failed, batch, first_row = 0, 0, [], 1
+        for row in chain(rows, [None]):
+            if row is not None:
+                batch.append(row)
+            if batch and (row is None or len(batch) >= batch_size):
+                inserted, errors = ingest_measurements(batch, first_row)
+                for error in errors:
+                    click.echo(f"Row {error['row']}: {error['error']}", err=True)
+                total_inserted += inserted
+                total_failed += len(errors)
+                first_row += len(batch)
+                batch = []
+
+    click.echo(f'Inserted {total_inserted} measurements, {total_failed} failed')
+
+@bp.cli.command('set-threshold')
+@click.argument('parameter', type=click.Choice(THRESHOLD_PARAMETERS))
+@click.option('--substation', help='Limit applies to this substation only.')
+@click.option('--voltage-level', help='Limit applies to this voltage level only.')
+@click.option('--bay', help='Limit applies to this bay only.')
+@click.option('--low', type=float, help='Alert when a value falls below this limit.')
+@click.option('--high', type=float, help='Alert when a value exceeds this limit.')
+def set_threshold_command(parameter, substation, voltage_level, bay, low, high):
+    """Create or replace a threshold limit for PARAMETER."""
+    limit = ThresholdLimit.query.filter_by(parameter=parameter, substation_name=substation,
+                                           voltage_level=voltage_level, bay_name=bay).first()
+    if low is None and high is None:
+        if limit:
+            db.session.delete(limit)
+            db.session.commit()
+        click.echo(f'Removed limit for {parameter}')
+        return
+
+    if not limit:
+        limit = ThresholdLimit(parameter=parameter, substation_name=substation,
+                               voltage_level=voltage_level, bay_name=bay)
+        db.session.add(limit)
+    limit.low_limit = low
+    limit.high_limit = high
+    db.session.commit()
+    click.echo(f'Saved limit for {parameter}: low={low} high={high}')
+
+@bp.cli.command('derive-quantities')
+@click.option('--batch-size', default=EXPORT_CHUNK_SIZE, show_default=True, help='Records updated per batch.')
+def derive_quantities_command(batch_size):
+    """Recompute the stored derived quantities for every record."""
+    source_columns = ['id', 'timestamp', 'substation_name', 'bay_name', 'ct_ratio', 'active_power', 'reactive_power',
+                      *[LINE_VALUE_COLUMNS[phase] for phase in ['IA', 'IB', 'IC', 'VA', 'VB', 'VC']],
+                      *[f'{winding}_{field}' for winding in ['hv', 'mv', 'lv']
+                        for field in ['ia', 'ib', 'ic', 'ct_ratio', 'active_power', 'reactive_power']]]
+    table = MeasurementRecord.__table__
+    total = 0
+    for shard in get_shards():
+        last_id = 0
+        with use_shard(shard):
+            while True:
+                rows = db.session.execute(select(*[table.c[column] for column in source_columns])
+                                          .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)).all()
+                if not rows:
+                    break
+                frame = pd.DataFrame(rows, columns=source_columns)
+                derived = derive_quantities(frame)[DERIVED_FIELDS].astype(object)
+                derived = derived.where(derived.notna(), None).assign(record_id=frame['id'])
+                db.session.execute(table.update().where(table.c.id == bindparam('record_id')),
+                                   derived.to_dict('records'))
+                bump_frame_versions(frame.rename(columns={'substation_name': 'substation', 'bay_name': 'bay'}))
+                db.session.commit()
+                last_id = int(frame['id'].iloc[-1])
+                total += len(frame)
+    click.echo(f'Derived quantities updated for {total} records')
+    click.echo(f'Refreshed {refresh_transformer_days_by_substation()} transformer days')
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute every rollup bucket from the raw measurements."""
+    for shard in get_shards():
+        with use_shard(shard):
+            db.session.execute(MeasurementRollup.__table__.delete())
+    total = 0
+    for chunk in iter_export_chunks(filters=get_report_filters({})):
+        values = chunk[chunk['parameter'].isin(ROLLUP_PARAMETERS)]
+        update_rollups(values[['timestamp', 'substation', 'bay', 'parameter', 'value']])
+        # Creates the versions a legacy database is missing, and invalidates
+        # every cached report over the rebuilt days
+        bump_frame_versions(chunk)
+        total += chunk['record_id'].nunique()
+    db.session.commit()
+    click.echo(f'Rebuilt rollups from {total} records')
+    click.echo(f'Refreshed {refresh_transformer_days_by_substation()} transformer days')
+
+@bp.cli.command('rebuild-anomaly-state')
+def rebuild_anomaly_state_command():
+    """Recompute the anomaly detection state from the full measurement history."""
+    for shard in get_shards():
+        with use_shard(shard):
+            db.session.execute(AnomalyState.__table__.delete())
+    record_fields = list(ANOMALY_LOAD_FIELDS) + sorted(set(ANOMALY_LOAD_FIELDS.values()))
+    total = 0
+    # One substation at a time keeps a single site's history in memory
+    for substation in get_substations():
+        values = get_anomaly_values(load_report_data(get_report_filters({'substation': substation}),
+                                                     record_fields=record_fields))
+        if values.empty:
+            continue
+        _, states = score_anomalies(values)
+        with use_shard(get_shard(substation)):
+            store_anomaly_states(states)
+        total += len(states)
+    db.session.commit()
+    click.echo(f'Rebuilt anomaly state for {total} locations and parameters')
+
+def refresh_transformer_days_by_substation(substations=None):
+    # One substation at a time keeps a single site's readings in memory
+    total = 0
+    for substation in substations or get_substations():
+        total += refresh_transformer_days(get_report_filters({'substation': substation}))
         db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        raise ValueError(f"Phase measurement error: {str(e)}")
+    return total
+
+@bp.cli.command('refresh-transformer-days')
+def refresh_transformer_days_command():
+    """Recompute the daily transformer loading and aging results whose data has changed."""
+    click.echo(f'Refreshed {refresh_transformer_days_by_substation()} transformer days')
+
+@bp.cli.command('generate-reports')
+@click.option('--month', type=click.DateTime(['%Y-%m']), help='Month to report on [default: the last full month].')
+@click.option('--format', 'formats', type=click.Choice(BATCH_REPORT_FORMATS), multiple=True,
+              help='Document format; repeat for several [default: all].')
+@click.option('--substation', 'substations', multiple=True,
+              help='Substation to report on; repeat for several [default: all].')
+@click.option('--output-dir', type=click.Path(file_okay=False),
+              help='Directory for the reports [default: BATCH_REPORT_DIR].')
+@click.option('--workers', type=int, help='Substations rendered in parallel [default: BATCH_REPORT_WORKERS].')
+@click.option('--force', is_flag=True, help='Also regenerate reports whose data has not changed.')
+def generate_reports_command(month, formats, substations, output_dir, workers, force):
+    """Render the monthly PDF/DOCX report of every substation, for example from a scheduled job."""
+    if month is None:
+        month = (datetime.now().replace(day=1) - timedelta(days=1)).replace(day=1)
+    month_end = (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    output_dir = os.path.join(output_dir or current_app.config['BATCH_REPORT_DIR'], f'{month:%Y-%m}')
+    formats = sorted(set(formats or BATCH_REPORT_FORMATS))
+
+    # Each report is stamped with its data version and the threshold limits, so
+    # a rerun (after an interruption or on the next schedule) only renders the
+    # substations that are missing or whose data or limits changed.
+    manifest = read_batch_manifest(output_dir)
+    limits = get_threshold_limits().to_json(orient='records')
+    refresh_transformer_days_by_substation(substations)
+    pending = []
+    for substation in substations or get_substations():
+        filters = {'start_date': f'{month:%Y-%m-%d}', 'end_date': f'{month_end:%Y-%m-%d}',
+                   'substation': substation, 'bay': None}
+        version = get_data_version(filters)
+        if not version:
+            click.echo(f'Skipped {substation}: no data for {month:%Y-%m}')
+            continue
+        stamp = hashlib.sha1(json.dumps([version, limits, formats]).encode()).hexdigest()
+        entry = manifest.get(substation)
+        if not force and entry and entry['stamp'] == stamp and \
+                all(os.path.exists(os.path.join(output_dir, name)) for name in entry['files']):
+            click.echo(f"Skipped {substation}: unchanged since {entry['generated']}")
+            continue
+        pending.append((substation, filters, stamp))
+    if not pending:
+        click.echo(f'All reports in {output_dir} are up to date')
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    failures = 0
+    # Spawned like the report job pool, so workers do not inherit this process's connections
+    with create_job_pool(workers or current_app.config['BATCH_REPORT_WORKERS']) as pool:
+        futures = {pool.submit(write_substation_report, substation, filters, formats, output_dir): (substation, stamp)
+                   for substation, filters, stamp in pending}
+        for future in as_completed(futures):
+            substation, stamp = futures[future]
+            try:
+                files = future.result()
+            except Exception as e:
+                failures += 1
+                click.echo(f'Failed {substation}: {str(e)}', err=True)
+                continue
+            manifest[substation] = {'stamp': stamp, 'files': files,
+                                    'generated': datetime.now().isoformat(timespec='seconds')}
+            write_batch_manifest(output_dir, manifest)
+            click.echo(f"Wrote {', '.join(files)} for {substation}")
+    if failures:
+        raise click.ClickException(f'{failures} substation reports failed; rerun to retry them')
+    click.echo(f'Wrote {len(pending)} substation reports to {output_dir}')
+
+@bp.cli.command('verify-rollups')
+@click.option('--tolerance', default=1e-6, show_default=True,
+              help='Largest relative difference accepted for the mean and M2.')
+def verify_rollups_command(tolerance):
+    """Recompute the rollup accumulators from the raw measurements and report drift."""
+    keys = ['granularity', 'bucket_start', 'substation', 'bay', 'parameter']
+    partials = []
+    for chunk in iter_export_chunks(filters=get_report_filters({})):
+        values = chunk[chunk['parameter'].isin(ROLLUP_PARAMETERS)]
+        if not values.empty:
+            partials.append(compute_rollups(values[['timestamp', 'substation', 'bay', 'parameter', 'value']]))
+    expected = merge_moments(pd.concat(partials, ignore_index=True), keys).reset_index() \
+        if partials else pd.DataFrame(columns=keys + ['count', 'min', 'max', 'mean', 'm2'])
+
+    stored = concat_frames(query_shards(get_shards(), select_frame, select(
+        MeasurementRollup.granularity, MeasurementRollup.bucket_start, MeasurementRollup.substation_name,
+        MeasurementRollup.bay_name, MeasurementRollup.parameter, MeasurementRollup.value_count,
+        MeasurementRollup.min_value, MeasurementRollup.max_value, MeasurementRollup.value_mean,
+        MeasurementRollup.value_m2), keys + ['count', 'min', 'max', 'mean', 'm2']))
+
+    for frame in (expected, stored):
+        frame[['granularity', 'substation', 'bay', 'parameter']] = \
+            frame[['granularity', 'substation', 'bay', 'parameter']].astype(str)
+        frame['bucket_start'] = pd.to_datetime(frame['bucket_start'])
+    compared = expected.merge(stored, on=keys, how='outer', suffixes=('_expected', '_stored'), indicator='state')
+    compared['state'] = compared['state'].map({'left_only': 'missing', 'right_only': 'unexpected', 'both': 'drifted'})
+
+    problems = compared['state'] != 'drifted'
+    for column in ['count', 'min', 'max', 'mean', 'm2']:
+        expected_value = compared[f'{column}_expected'].astype(float)
+        stored_value = compared[f'{column}_stored'].astype(float)
+        scale = np.maximum(expected_value.abs(), 1)
+        problems |= (compared['state'] == 'drifted') & ((expected_value - stored_value).abs() > tolerance * scale)
+
+    for row in compared[problems].head(20).itertuples():
+        click.echo(f'{row.state}: {row.granularity} {row.bucket_start} {row.substation}/{row.bay} {row.parameter} '
+                   f'count {row.count_expected}/{row.count_stored} mean {row.mean_expected}/{row.mean_stored} '
+                   f'm2 {row.m2_expected}/{row.m2_stored}', err=True)
+    if problems.any():
+        raise click.ClickException(f'{int(problems.sum())} of {len(compared)} rollup buckets differ '
+                                   f'from the raw measurements; run rebuild-rollups to repair them')
+    click.echo(f'All {len(compared)} rollup buckets match the raw measurements')
+
+@bp.cli.command('archive-measurements')
+@click.option('--older-than-days', type=int, help='Archive readings older than this many days '
+                                                  '[default: ARCHIVE_AFTER_DAYS].')
+def archive_measurements_command(older_than_days):
+    """Move old readings out of the database into monthly Parquet files per substation."""
+    if importlib.util.find_spec('pyarrow') is None:
+        raise click.ClickException('Archiving requires the pyarrow package')
+
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if older_than_days is None else older_than_days
+    cutoff = datetime.now() - timedelta(days=days)
+    table = MeasurementRecord.__table__
+    columns = [column.name for column in table.columns]
+    manifest = {entry['path']: entry for entry in read_archive_manifest()}
+    os.makedirs(get_archive_path(), exist_ok=True)
+    total, archived = 0, set()
+    for shard in get_shards():
+        with use_shard(shard):
+            while True:
+                first = db.session.execute(select(func.min(table.c.timestamp))
+                                           .where(table.c.timestamp < cutoff)).scalar()
+                if first is None:
+                    break
+                month = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                month_end = min((month + timedelta(days=32)).replace(day=1), cutoff)
+                in_month = and_(table.c.timestamp >= month, table.c.timestamp < month_end)
+                substations = db.session.execute(select(table.c.substation_name).where(in_month).distinct()).scalars()
+                for substation in substations.all():
+                    rows = db.session.execute(select(table).where(in_month,
+                                                                  table.c.substation_name == substation)).all()
+                    records = pd.DataFrame(rows, columns=columns)
+                    entry = write_archive_file(substation, month, records)
+                    manifest[entry['path']] = entry
+                    write_archive_manifest(manifest.values())
+                    # Deleted by id, so readings written since the select stay for the next run.
+                    # A crash before the commit leaves rows in both places; the next run
+                    # merges them into the file again without duplicating them.
+                    ids = records['id'].tolist()
+                    for offset in range(0, len(ids), ARCHIVE_DELETE_BATCH_SIZE):
+                        db.session.execute(table.delete().where(
+                            table.c.id.in_(ids[offset:offset + ARCHIVE_DELETE_BATCH_SIZE])))
+                    # Cached reports of these days were built before their readings moved
+                    bump_day_versions(zip(records['substation_name'], records['bay_name'],
+                                          (timestamp.to_pydatetime() for timestamp in records['timestamp'])))
+                    db.session.commit()
+                    total += len(records)
+                    archived.add(substation)
+                    click.echo(f'Archived {len(records)} records of {substation} for {month:%Y-%m}')
+    click.echo(f'Archived {total} records older than {cutoff:%Y-%m-%d %H:%M}')
+    if archived:
+        click.echo(f'Refreshed {refresh_transformer_days_by_substation(sorted(archived))} transformer days')
+
+def capture_select_statements(callback):
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        callback()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+    return statements
+
+@bp.cli.command('split-shards')
+@click.option('--batch-size', default=EXPORT_CHUNK_SIZE, show_default=True, help='Rows copied per batch.')
+def split_shards_command(batch_size):
+    """Move the substations assigned in SHARD_MAP out of the default database into their shards."""
+    for shard in set(current_app.config['SHARD_MAP'].values()):
+        if not sa_inspect(db.engines[shard]).has_table(MeasurementRecord.__tablename__):
+            raise click.ClickException(f'Shard {shard} has no tables yet; run "flask db upgrade" first')
+
+    with use_shard(None):
+        present = db.session.execute(select(Substation.name)).scalars().all()
+    moves = [(substation, current_app.config['SHARD_MAP'][substation]) for substation in present
+             if substation in current_app.config['SHARD_MAP']]
+    if not moves:
+        click.echo('Every mapped substation is already in its shard')
+        return
+
+    for substation, shard in moves:
+        with use_shard(None):
+            substation_id = db.session.execute(select(Substation.id).where(Substation.name == substation)).scalar()
+        # Rows keep their ids so bay_id and substation_id stay valid in the shard.
+        # A run that was interrupted before the delete copies again and skips the
+        # rows already there; children are deleted before their parents.
+        tables = [
+            (Substation.__table__, Substation.__table__.c.id == substation_id),
+            (Bay.__table__, Bay.__table__.c.substation_id == substation_id),
+            (MeasurementRecord.__table__, MeasurementRecord.__table__.c.substation_name == substation),
+            (MeasurementRollup.__table__, MeasurementRollup.__table__.c.substation_name == substation),
+            (DataVersion.__table__, DataVersion.__table__.c.substation_name == substation),
+            (AnomalyState.__table__, AnomalyState.__table__.c.substation_name == substation),
+            (TransformerDay.__table__, TransformerDay.__table__.c.substation_name == substation),
+        ]
+        copied = 0
+        for table, condition in tables:
+            last_id = 0
+            while True:
+                with use_shard(None):
+                    rows = db.session.execute(select(table).where(condition, table.c.id > last_id)
+                                              .order_by(table.c.id).limit(batch_size)).mappings().all()
+                if not rows:
+                    break
+                with use_shard(shard):
+                    db.session.execute(dialect_insert(table).on_conflict_do_nothing(), [dict(row) for row in rows])
+                    db.session.commit()
+                last_id = rows[-1]['id']
+                if table is MeasurementRecord.__table__:
+                    copied += len(rows)
+        with use_shard(None):
+            for table, condition in reversed(tables):
+                db.session.execute(table.delete().where(condition))
+            db.session.commit()
+        click.echo(f'Moved {substation} with {copied} records to shard {shard}')
+    invalidate_dimension_cache()
+    get_report_cache().clear()
+
+def get_plan_check_scenarios():
+    filters = {'start_date': '2024-01-01', 'end_date': '2024-01-31', 'substation': 'plan-check', 'bay': 'plan-check'}
+    bay_filters = dict(filters, substation=None)
+    location_filters = dict(filters, substation=None, bay=None,
+                            locations=[('plan-check', 'plan-check'), ('plan-check', 'plan-check-2'),
+                                       ('plan-check-2', 'plan-check')])
+    return {
+        'index listing': lambda: get_record_page(
+            get_listing_filters({'substation': 'plan-check', 'bay': 'plan-check'}), '2024-01-15T00:00:00_1'),
+        'index listing by bay': lambda: get_record_page(get_listing_filters({'bay': 'plan-check'})),
+        'summary report': lambda: (generate_phase_report(filters, 'current'),
+                                   generate_sequence_report(filters),
+                                   generate_summary_statistics(filters)),
+        'threshold report': lambda: load_report_data(filters, record_fields=RECORD_LIMIT_FIELDS),
+        'threshold report by bay': lambda: load_report_data(bay_filters, record_fields=RECORD_LIMIT_FIELDS),
+        'report cache version': lambda: (get_data_version(filters), get_data_version(bay_filters),
+                                         get_transformer_day_version(filters),
+                                         get_transformer_day_version(bay_filters)),
+        'transformer report': lambda: (get_transformer_days(filters), get_transformer_days(bay_filters),
+                                       find_stale_transformer_days(filters),
+                                       find_stale_transformer_days(bay_filters)),
+        'transformer ingest': lambda: (find_stale_transformer_days(location_filters),
+                                       load_transformer_readings(location_filters)),
+        'trend analysis': lambda: (load_report_data(filters, parameters=['IA', 'I0']),
+                                   load_rollup_series(filters, ['IA', 'I0'], 'hour')),
+        'export': lambda: list(iter_export_chunks(record_ids=[1, 2, 3])),
+    }
+
+def explain_scenario(scenario):
+    # The SQLite plan of every SELECT the scenario runs, with the steps that scan a whole measurement table
+    full_scan = re.compile(rf"^SCAN (TABLE )?({'|'.join(PLAN_CHECK_TABLES)})\b")
+    connection = db.session.connection()
+    plans = []
+    for statement, parameters in capture_select_statements(scenario):
+        plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+        plans.append((plan, [step for step in plan if full_scan.match(step)]))
+    return plans
+
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a report query scans a measurement table instead of using an index."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Query plan checks are only implemented for SQLite')
+
+    failures = 0
+    for name, scenario in get_plan_check_scenarios().items():
+        for plan, scans in explain_scenario(scenario):
+            failures += len(scans)
+            click.echo(f"[{'FAIL' if scans else 'ok'}] {name}: {' | '.join(plan)}")
+
+    if failures:
+        raise click.ClickException(f'{failures} full table scans in report queries')
+    click.echo('All report queries use indexes')
+
+def build_fleet(substations, transformers, lines, three_winding_share=0.3, rng=None):
+    rng = rng or np.random.default_rng()
+    fleet = []
+    for substation_number in range(1, substations + 1):
+        substation_name = f'SS-{substation_number:02d}'
+        voltage_level = rng.choice(list(FLEET_VOLTAGE_LEVELS))
+        for number in range(1, transformers + 1):
+            fleet.append({
+                'element_type': 'transformer', 'substation_name': substation_name, 'bay_name': f'TR-{number}',
+                'voltage_level': voltage_level,
+                'winding_type': 'three' if rng.random() < three_winding_share else 'two',
+                'mv_level': rng.choice(list(FLEET_DISTRIBUTION_LEVELS)),
+                'rating_mva': float(rng.choice([40, 63, 100, 150])),
+                'load_factor': rng.uniform(0.35, 0.8),
+            })
+        for number in range(1, lines + 1):
+            fleet.append({
+                'element_type': 'line', 'substation_name': substation_name, 'bay_name': f'LN-{number}',
+                'voltage_level': voltage_level,
+                'ct_ratio': float(rng.choice([600, 800, 1200, 1600, 2000])),
+                'load_factor': rng.uniform(0.25, 0.7),
+                'power_factor': rng.uniform(0.88, 0.98),
+            })
+    return fleet
+
+def generate_fleet_rows(fleet, start, periods, interval_minutes=15, rng=None):
+    # Yields ingest rows in time order, one per element per sampling interval,
+    # with a daily and seasonal load cycle, phase unbalance and thermal lag.
+    rng = rng or np.random.default_rng()
+    timestamps = pd.date_range(start, periods=periods, freq=f'{interval_minutes}min')
+    hours = timestamps.hour + timestamps.minute / 60
+    daily = 0.75 + 0.25 * np.sin(2 * np.pi * (hours - 9) / 24)
+    seasonal = 1 + 0.1 * np.cos(2 * np.pi * timestamps.dayofyear / 365)
+    ambient = 25 - 8 * np.cos(2 * np.pi * (timestamps.dayofyear - 15) / 365) + 4 * np.sin(2 * np.pi * (hours - 9) / 24)
+
+    for index, timestamp in enumerate(timestamps):
+        for element in fleet:
+            load = max(0.05, element['load_factor'] * daily[index] * seasonal[index] * rng.normal(1, 0.05))
+            row = {
+                'timestamp': timestamp.isoformat(),
+                'element_type': element['element_type'],
+                'substation_name': element['substation_name'],
+                'bay_name': element['bay_name'],
+                'voltage_level': element['voltage_level'],
+                'relay_type': 'distance' if element['element_type'] == 'line' else 'differential',
+            }
+            if element['element_type'] == 'line':
+                row.update(generate_line_values(element, load, rng))
+            else:
+                row.update(generate_transformer_values(element, load, ambient[index], rng))
+            yield row
+
+def generate_line_values(element, load, rng):
+    kv = FLEET_VOLTAGE_LEVELS[element['voltage_level']]
+    currents = element['ct_ratio'] * load * rng.normal(1, 0.02, 3)
+    voltages = kv / np.sqrt(3) * rng.normal(1, 0.01, 3)
+    active_power = np.sqrt(3) * kv * currents.mean() * element['power_factor'] / 1000
+    values = {
+        'IA': currents[0], 'IB': currents[1], 'IC': currents[2], 'IN': abs(currents[0] - currents[1:].mean()),
+        'VA': voltages[0], 'VB': voltages[1], 'VC': voltages[2], 'VN': abs(rng.normal(0, 0.2)),
+        'I0': currents.std() / 3, 'I1': currents.mean(), 'I2': currents.mean() * rng.uniform(0.005, 0.03),
+        'V0': voltages.std() / 3, 'V1': voltages.mean(), 'V2': voltages.mean() * rng.uniform(0.002, 0.01),
+    }
+    row = {f'{parameter}_value': round(float(value), 2) for parameter, value in values.items()}
+    row.update(active_power=round(float(active_power), 2),
+               reactive_power=round(float(active_power * np.tan(np.arccos(element['power_factor']))), 2),
+               ct_ratio=element['ct_ratio'])
+    return row
+
+def generate_transformer_values(element, load, ambient, rng):
+    windings = [('hv', FLEET_VOLTAGE_LEVELS[element['voltage_level']], 1.0),
+                ('mv', FLEET_DISTRIBUTION_LEVELS[element['mv_level']], 1.0)]
+    if element['winding_type'] == 'three':
+        windings = [('hv', windings[0][1], 1.0), ('mv', windings[1][1], 0.7), ('lv', 11, 0.3)]
+
+    oil_temp = ambient + 45 * load ** 2 + rng.normal(0, 0.5)
+    row = {'winding_type': element['winding_type'], 'oil_temp': round(float(oil_temp), 1),
+           'tap_position': int(np.clip(round(9 + 6 * (load - 0.5) + rng.normal(0, 0.5)), 1, 17))}
+    for winding, kv, share in windings:
+        rated_current = element['rating_mva'] * share * 1000 / (np.sqrt(3) * kv)
+        currents = rated_current * load * rng.normal(1, 0.015, 3)
+        active_power = element['rating_mva'] * share * load * 0.95
+        row.update({
+            f'{winding}_ia': round(float(currents[0]), 2),
+            f'{winding}_ib': round(float(currents[1]), 2),
+            f'{winding}_ic': round(float(currents[2]), 2),
+            f'{winding}_ct_ratio': float(np.ceil(rated_current * 1.2 / 100) * 100),
+            f'{winding}_active_power': round(float(active_power), 2),
+            f'{winding}_reactive_power': round(float(active_power * 0.33), 2),
+            f'{winding}_winding_temp': round(float(oil_temp + 23 * load ** 1.6 + rng.normal(0, 0.5)), 1),
+        })
+    return row
+
+@bp.cli.command('generate-fleet')
+@click.option('--substations', default=5, show_default=True, help='Number of substations.')
+@click.option('--transformers', default=2, show_default=True, help='Transformer bays per substation.')
+@click.option('--lines', default=4, show_default=True, help='Line bays per substation.')
+@click.option('--three-winding-share', default=0.3, show_default=True,
+              help='Fraction of transformers with a tertiary (LV) winding.')
+@click.option('--start', type=click.DateTime(), default='2024-01-01', show_default=True,
+              help='Timestamp of the first reading.')
+@click.option('--days', default=365, show_default=True, help='Length of the generated history.')
+@click.option('--interval', default=15, show_default=True, help='Sampling interval in minutes.')
+@click.option('--seed', default=0, show_default=True, help='Random seed, so fleets can be regenerated.')
+@click.option('--batch-size', default=INGEST_BATCH_SIZE, show_default=True,
+              help='Measurements committed per transaction.')
+def generate_fleet_command(substations, transformers, lines, three_winding_share, start, days, interval,
+                           seed, batch_size):
+    """Fill the database with synthetic readings for a fleet of substations."""
+    rng = np.random.default_rng(seed)
+    fleet = build_fleet(substations, transformers, lines, three_winding_share, rng)
+    periods = days * 24 * 60 // interval
+    total, batch = 0, []
+    for row in chain(generate_fleet_rows(fleet, start, periods, interval, rng), [None]):
+        if row is not None:
+            batch.append(row)
+        if batch and (row is None or len(batch) >= batch_size):
+            inserted, errors = ingest_measurements(batch, total + 1)
+            if errors:
+                raise click.ClickException(f"Generated row {errors[0]['row']} was rejected: {errors[0]['error']}")
+            total += inserted
+            batch = []
+    click.echo(f'Generated {total} readings for {len(fleet)} bays in {substations} substations')
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
+        upgrade()
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 3000)))
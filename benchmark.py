@@ -0,0 +1,296 @@
+"""Time the main pages and ingest against synthetic fleets of several sizes.
+
+    python benchmark.py --scales 10000,100000 --output results.json
+    python benchmark.py --scales 10000,100000 --compare results.json
+
+Each scale gets a fresh SQLite database filled by the generate-fleet
+generator. Wall time is the median of --repeat runs; SQL statements are
+counted with an engine event hook and peak Python memory comes from one
+extra tracemalloc run, so it does not slow down the timed runs.
+
+Worker startup is measured separately in fresh interpreters: importing the
+app and building it, the first page and first ingest of a cold worker, and
+the private memory of a worker forked from a warmed-up (preloaded) master.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BENCHMARK_FORMAT = 1
+FLEET = {'substations': 4, 'transformers': 2, 'lines': 4}
+INGEST_ROWS = 1000
+
+
+def run_scenario(client, engine, scenario):
+    from sqlalchemy import event
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        start = time.perf_counter()
+        response = scenario(client)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+    if response.status_code >= 400:
+        raise RuntimeError(f'Scenario returned HTTP {response.status_code}')
+    return elapsed, len(statements)
+
+
+def build_scenarios(appmod, fleet, ingest_start, runs, rng):
+    # Ingest batches are generated up front so only the request itself is timed
+    periods = math.ceil(INGEST_ROWS / len(fleet))
+    ingest_batches = []
+    for run in range(runs):
+        start = ingest_start + timedelta(minutes=15 * periods * run)
+        ingest_batches.append(list(appmod.generate_fleet_rows(fleet, start, periods, rng=rng))[:INGEST_ROWS])
+
+    def ingest(client):
+        return client.post('/api/measurements', json=ingest_batches.pop(0))
+
+    def uncached(report):
+        # The report cache would otherwise answer every run after the first
+        def scenario(client):
+            appmod.get_report_cache().clear()
+            return report(client)
+        return scenario
+
+    etags = {}
+
+    def revalidate(client):
+        if 'summary' not in etags:
+            etags['summary'] = client.get('/reports/summary', query_string={'substation': ''}).headers['ETag']
+        return client.get('/reports/summary', query_string={'substation': ''},
+                          headers={'If-None-Match': etags['summary']})
+
+    return {
+        'index': lambda client: client.get('/'),
+        'export_csv': lambda client: client.post('/export', data={'format': 'csv', 'export_scope': 'filtered'}),
+        'export_parquet': lambda client: client.post('/export', data={'format': 'parquet',
+                                                                     'export_scope': 'filtered'}),
+        'summary_report': uncached(lambda client: client.post('/reports/summary', data={})),
+        'threshold_report': uncached(lambda client: client.post('/reports/thresholds', data={})),
+        'trend_analysis': uncached(lambda client: client.post('/reports/trends', data={'parameters': ['IA', 'I0']})),
+        # The stored transformer days stay; only the rendered report is dropped
+        'transformer_report': uncached(lambda client: client.post('/reports/transformers', data={})),
+        'summary_revalidate': revalidate,
+        'ingest': ingest,
+    }
+
+
+def benchmark_scale(appmod, app, scale, repeat, seed):
+    import numpy as np
+
+    db = appmod.db
+    rng = np.random.default_rng(seed)
+    db.drop_all()
+    db.create_all()
+    appmod.invalidate_dimension_cache()
+    appmod.get_report_cache().clear()
+
+    fleet = appmod.build_fleet(rng=rng, **FLEET)
+    periods = math.ceil(scale / len(fleet))
+    start = datetime(2024, 1, 1)
+    rows = appmod.generate_fleet_rows(fleet, start, periods, rng=rng)
+    started = time.perf_counter()
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= appmod.INGEST_BATCH_SIZE:
+            appmod.ingest_measurements(batch)
+            batch = []
+    if batch:
+        appmod.ingest_measurements(batch)
+    load_seconds = time.perf_counter() - started
+
+    client = app.test_client()
+    ingest_start = start + timedelta(minutes=15 * periods)
+    results = {'records': periods * len(fleet), 'load_seconds': round(load_seconds, 3), 'scenarios': {}}
+    for name, scenario in build_scenarios(appmod, fleet, ingest_start, repeat + 1, rng).items():
+        timings = [run_scenario(client, db.engine, scenario) for _ in range(repeat)]
+        tracemalloc.start()
+        run_scenario(client, db.engine, scenario)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results['scenarios'][name] = {
+            'wall_seconds': round(statistics.median(elapsed for elapsed, _ in timings), 4),
+            'min_wall_seconds': round(min(elapsed for elapsed, _ in timings), 4),
+            'queries': timings[-1][1],
+            'peak_memory_mb': round(peak_memory / 2 ** 20, 2),
+        }
+        print(f"{scale:>10} {name:<18} {results['scenarios'][name]['wall_seconds']:>9.4f}s "
+              f"{results['scenarios'][name]['queries']:>6} queries "
+              f"{results['scenarios'][name]['peak_memory_mb']:>9.2f} MB", file=sys.stderr)
+    return results
+
+
+STARTUP_PROBE = r"""
+import json, os, sys, time
+started = time.perf_counter()
+import app as appmod
+flask_app = appmod.create_app({'WTF_CSRF_ENABLED': False})
+probe = sys.argv[1]
+if probe == 'first_page':
+    with flask_app.app_context():
+        appmod.db.create_all()
+    flask_app.test_client().get('/').get_data()
+elif probe == 'first_ingest':
+    with flask_app.app_context():
+        appmod.db.create_all()
+    fleet = appmod.build_fleet(substations=1, transformers=1, lines=1)
+    rows = list(appmod.generate_fleet_rows(fleet, appmod.datetime(2024, 1, 1), 1))
+    flask_app.test_client().post('/api/measurements', json=rows).get_data()
+elif probe == 'preload_worker':
+    appmod.warm_up(flask_app)
+elapsed = time.perf_counter() - started
+
+
+def private_mb():
+    with open('/proc/self/smaps_rollup') as smaps:
+        fields = dict(line.split(':', 1) for line in smaps if ':' in line)
+    return sum(int(fields.get(key, '0 kB').split()[0]) for key in ['Private_Clean', 'Private_Dirty']) / 1024
+
+
+if probe == 'preload_worker':
+    # What a forked worker costs on top of the shared master pages
+    reader, writer = os.pipe()
+    if os.fork() == 0:
+        os.close(reader)
+        flask_app.test_client().get('/').get_data()
+        os.write(writer, str(private_mb()).encode())
+        os._exit(0)
+    os.close(writer)
+    memory = float(os.read(reader, 64).decode())
+    os.wait()
+else:
+    import resource
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({'seconds': elapsed, 'memory_mb': memory, 'pandas_loaded': 'pandas.core.frame' in sys.modules}))
+"""
+STARTUP_PROBES = ['create_app', 'first_page', 'first_ingest', 'preload_worker']
+
+
+def benchmark_startup(repeat):
+    results = {}
+    for probe in STARTUP_PROBES:
+        if probe == 'preload_worker' and not os.path.exists('/proc/self/smaps_rollup'):
+            continue
+        runs = []
+        for _ in range(repeat):
+            workdir = tempfile.mkdtemp(prefix='substation-startup-')
+            env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'startup.db'))
+            env.setdefault('SECRET_KEY', 'benchmark')
+            output = subprocess.run([sys.executable, '-c', STARTUP_PROBE, probe], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[probe] = {
+            'wall_seconds': round(statistics.median(run['seconds'] for run in runs), 4),
+            'min_wall_seconds': round(min(run['seconds'] for run in runs), 4),
+            'peak_memory_mb': round(max(run['memory_mb'] for run in runs), 2),
+            'pandas_loaded': runs[-1]['pandas_loaded'],
+        }
+        print(f"{'startup':>10} {probe:<18} {results[probe]['wall_seconds']:>9.4f}s "
+              f"{results[probe]['peak_memory_mb']:>16.2f} MB", file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline, current, tolerance):
+    regressions = []
+    for scale, result in current['results'].items():
+        previous = baseline['results'].get(scale)
+        if not previous:
+            continue
+        for name, metrics in result['scenarios'].items():
+            old = previous['scenarios'].get(name)
+            if not old:
+                continue
+            # The fastest run is the least noisy estimate of the code's own cost
+            for metric in ['min_wall_seconds', 'queries', 'peak_memory_mb']:
+                if old.get(metric) and metrics.get(metric, 0) > old[metric] * (1 + tolerance):
+                    regressions.append(f'{scale} {name} {metric}: {old[metric]} -> {metrics[metric]}')
+    for name, metrics in current.get('startup', {}).items():
+        old = baseline.get('startup', {}).get(name)
+        if not old:
+            continue
+        for metric in ['min_wall_seconds', 'peak_memory_mb']:
+            if old.get(metric) and metrics.get(metric, 0) > old[metric] * (1 + tolerance):
+                regressions.append(f'startup {name} {metric}: {old[metric]} -> {metrics[metric]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='10000,100000',
+                        help='Comma separated record counts to benchmark (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per scenario (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the fleet (default: %(default)s)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown before --compare reports a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='substation-benchmark-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    startup = benchmark_startup(args.repeat)
+    import app as appmod
+    app = appmod.create_app({'WTF_CSRF_ENABLED': False})
+
+    report = {
+        'format': BENCHMARK_FORMAT,
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'fleet': FLEET,
+        'startup': startup,
+        'results': {},
+    }
+    with app.app_context():
+        for scale in [int(value) for value in args.scales.split(',')]:
+            report['results'][str(scale)] = benchmark_scale(appmod, app, scale, args.repeat, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(baseline, report, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {baseline.get('revision') or args.compare}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
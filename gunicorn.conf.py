@@ -0,0 +1,40 @@
+"""Gunicorn settings for the web process.
+
+    gunicorn --config gunicorn.conf.py
+
+The app is built once in the master (preload) and warmed up there, so the
+forked workers share pandas, numpy, matplotlib and the compiled templates
+copy-on-write instead of importing them again each.
+
+Workers are threaded: every open index page holds a /stream response (Server-
+Sent Events) for as long as it is open, and with sync workers two tabs would
+take the whole app down until the worker timeout. Each worker's threads are
+split between those streams and everything else: at most STREAM_MAX_CLIENTS
+(default 8) streams are open per worker, and further pages get a 503 and try
+again later, so GUNICORN_THREADS - STREAM_MAX_CLIENTS threads always remain
+for ingest, reports and page loads. Raise both together for more open pages.
+
+Live events are published inside the worker process that handled the write, so
+a page only sees the readings ingested by its own worker. With more than one
+worker (WEB_CONCURRENCY) the live listing is a best-effort preview; the page
+still shows every reading when it is reloaded or paged.
+
+/metrics is per worker too: each scrape answers with the counters of the worker
+that handled it, labelled with its pid. Aggregate across the pid series in the
+queries instead of reading a single scrape.
+"""
+import os
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', 3000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# gthread keeps heartbeating while a thread streams, so open streams do not hit the worker timeout
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is built and before any fork
+    from app import warm_up
+    warm_up(server.app.wsgi())
@@ -0,0 +1,25 @@
+"""Drop 15min rollups
+
+Revision ID: a3f7c1e9b546
+Revises: d1e5a9c7b382
+Create Date: 2026-10-18 21:14:37.520946
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f7c1e9b546'
+down_revision = 'd1e5a9c7b382'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # At the 15 minute sampling interval these buckets held one reading each
+    op.execute("DELETE FROM measurement_rollup WHERE granularity = '15min'")
+
+
+def downgrade():
+    # The rows are gone; flask rebuild-rollups of the older release writes them again
+    pass
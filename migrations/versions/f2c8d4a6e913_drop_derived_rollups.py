@@ -0,0 +1,31 @@
+"""Drop derived rollups
+
+Revision ID: f2c8d4a6e913
+Revises: a3f7c1e9b546
+Create Date: 2026-10-18 21:48:05.113870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8d4a6e913'
+down_revision = 'a3f7c1e9b546'
+branch_labels = None
+depends_on = None
+
+DERIVED_COLUMNS = ['apparent_power', 'power_factor', 'current_unbalance', 'voltage_unbalance', 'loading'] + \
+    [f'{winding}_{quantity}' for winding in ['hv', 'mv', 'lv']
+     for quantity in ['apparent_power', 'power_factor', 'current_unbalance', 'loading']]
+
+
+def upgrade():
+    # Derived quantities are read from the records; their rollups were never used
+    rollup = sa.table('measurement_rollup', sa.column('parameter'))
+    op.execute(rollup.delete().where(rollup.c.parameter.in_(DERIVED_COLUMNS)))
+
+
+def downgrade():
+    # The rows are gone; flask rebuild-rollups of the older release writes them again
+    pass
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+from flask_migrate import upgrade
+
+from app import build_fleet, create_app, generate_fleet_rows, ingest_measurements, invalidate_dimension_cache
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    # Apps over the same temporary SQLite files, with the schema built by the
+    # migrations rather than create_all so the tests cover them too
+    def make_app(shards=(), shard_map=None, revision='head', **config):
+        app = create_app({
+            'SECRET_KEY': 'test',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'default.db'}",
+            'SQLALCHEMY_BINDS': {shard: f"sqlite:///{tmp_path / shard}.db" for shard in shards},
+            'SHARD_MAP': shard_map or {},
+            'REPORT_CACHE': 'none',
+            'REPORT_CACHE_DIR': str(tmp_path / 'report_cache'),
+            'REPORT_JOB_DIR': str(tmp_path / 'report_jobs'),
+            'ARCHIVE_DIR': str(tmp_path / 'archive'),
+            'BATCH_REPORT_DIR': str(tmp_path / 'batch_reports'),
+            **config,
+        })
+        with app.app_context():
+            upgrade(directory=MIGRATIONS_DIR, revision=revision)
+        invalidate_dimension_cache()
+        return app
+    return make_app
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def ingest_fleet():
+    # Ingests a generated fleet of one transformer and one line per substation
+    # at 15 minute readings, in batches so the rollups are merged across them
+    def ingest_fleet(start, days, substations=1, batch_size=100):
+        rng = np.random.default_rng(0)
+        fleet = build_fleet(substations=substations, transformers=1, lines=1, rng=rng)
+        rows = list(generate_fleet_rows(fleet, start, 96 * days, rng=rng))
+        for first in range(0, len(rows), batch_size):
+            _, errors = ingest_measurements(rows[first:first + batch_size], first_row=first + 1)
+            assert not errors
+        return len(rows)
+    return ingest_fleet
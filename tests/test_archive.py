@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+from app import (choose_trend_granularity, generate_summary_statistics, get_data_version, get_report_filters,
+                 get_transformer_days, read_archive_manifest)
+
+pytest.importorskip('pyarrow')
+
+FILTER_SETS = [
+    {},
+    {'substation': 'SS-02'},
+    # Part of an archived month and one bay, so the file itself is read
+    {'start_date': '2024-01-03', 'end_date': '2024-01-07', 'bay': 'LN-1'},
+]
+
+
+def test_archived_readings_stay_in_reports(app, ingest_fleet):
+    ingest_fleet(datetime(2024, 1, 1), days=10, substations=2)
+    filter_sets = [get_report_filters(form_data) for form_data in FILTER_SETS]
+    before = [generate_summary_statistics(filters) for filters in filter_sets]
+    transformer_days = get_transformer_days(get_report_filters({}))
+    version = get_data_version(get_report_filters({'end_date': '2024-01-05'}))
+    assert choose_trend_granularity(get_report_filters({})) == 'hour'
+
+    older_than_days = (datetime.now() - datetime(2024, 1, 6)).days
+    result = app.test_cli_runner().invoke(args=['archive-measurements', '--older-than-days', str(older_than_days)])
+    assert result.exit_code == 0, result.output
+    # The cutoff keeps the time of day, so five to six of the ten days are archived
+    assert 2 * 2 * 96 * 5 <= sum(entry['rows'] for entry in read_archive_manifest()) < 2 * 2 * 96 * 6
+
+    assert [generate_summary_statistics(filters) for filters in filter_sets] == before
+    assert before[0]['total_records'] == 2 * 2 * 96 * 10
+    assert before[0]['time_range']['start'] == '2024-01-01'
+    # The readings still in the database span less than the raw limit
+    assert choose_trend_granularity(get_report_filters({})) == 'hour'
+    assert get_data_version(get_report_filters({'end_date': '2024-01-05'})) > version
+    assert get_transformer_days(get_report_filters({})).equals(transformer_days)
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import numpy as np
+
+from app import IngestWriter, MeasurementRecord, build_fleet, generate_fleet_rows, validate_ingest_rows
+
+
+def test_write_behind_drops_only_the_failing_readings(app, caplog):
+    fleet = build_fleet(substations=1, transformers=1, lines=1, rng=np.random.default_rng(0))
+    readings, errors = validate_ingest_rows(generate_fleet_rows(fleet, datetime(2024, 1, 1), 5,
+                                                                rng=np.random.default_rng(0)))
+    assert not errors
+    readings[3][0]['relay_type'] = None
+
+    writer = IngestWriter(flush_seconds=0.05)
+    writer.submit(readings)
+    writer.flush()
+    writer.stop()
+
+    assert MeasurementRecord.query.count() == len(readings) - 1
+    assert writer.dropped == 1
+    assert 'Dropped 1 queued measurements' in caplog.text
+
+
+def test_batch_with_invalid_json_gets_a_json_error(app):
+    response = app.test_client().post('/api/measurements', data='{"measurements": [', content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid batch: Body is not valid JSON'}
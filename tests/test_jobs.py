@@ -0,0 +1,58 @@
+import os
+from datetime import datetime
+
+import docx
+import pytest
+
+from app import read_batch_manifest, read_job_status, report_job_futures
+
+SUMMARY_URL = '/reports/summary?start_date=2024-01-01&end_date=2024-01-31'
+
+
+@pytest.fixture
+def decoy_database(tmp_path, monkeypatch):
+    # Spawned workers that rebuilt their settings from the environment would read this empty database
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'decoy.db'}")
+
+
+def test_report_job_reads_the_submitting_app(make_app, ingest_fleet, decoy_database):
+    app = make_app(REPORT_JOBS=True, REPORT_CACHE='disk', REPORT_JOB_WORKERS=1)
+    try:
+        with app.app_context():
+            total = ingest_fleet(datetime(2024, 1, 1), days=2)
+        client = app.test_client()
+        response = client.get(SUMMARY_URL)
+        assert response.status_code == 302
+        job_id = response.location.rsplit('/', 1)[1]
+        report_job_futures[job_id].result(timeout=120)
+
+        with app.app_context():
+            assert read_job_status(job_id)['state'] == 'done'
+        result = client.get(response.location)
+        assert f'<p class="fs-3">{total}</p>' in result.get_data(as_text=True)
+        # The job left its result in the shared cache, so the report is now served directly
+        response = client.get(SUMMARY_URL)
+        assert response.status_code == 200
+        assert f'<p class="fs-3">{total}</p>' in response.get_data(as_text=True)
+    finally:
+        app.extensions['report_job_pool'].shutdown()
+
+
+def test_report_jobs_need_the_disk_cache(make_app):
+    with pytest.raises(ValueError, match='REPORT_CACHE=disk'):
+        make_app(REPORT_JOBS=True, REPORT_CACHE='memory')
+
+
+def test_generate_reports_reads_the_cli_app(make_app, ingest_fleet, decoy_database, tmp_path):
+    app = make_app()
+    with app.app_context():
+        total = ingest_fleet(datetime(2024, 1, 1), days=2)
+    output_dir = tmp_path / 'reports'
+    result = app.test_cli_runner().invoke(args=['generate-reports', '--month', '2024-01', '--format', 'docx',
+                                                '--output-dir', str(output_dir), '--workers', '1'])
+    assert result.exit_code == 0, result.output
+
+    month_dir = output_dir / '2024-01'
+    assert read_batch_manifest(month_dir)['SS-01']['files'] == ['SS-01.docx']
+    paragraphs = [paragraph.text for paragraph in docx.Document(os.fspath(month_dir / 'SS-01.docx')).paragraphs]
+    assert f'{total} records from 2 bays, 2024-01-01 00:00 to 2024-01-02 23:45' in paragraphs
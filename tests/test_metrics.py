@@ -0,0 +1,13 @@
+import os
+
+
+def test_metrics_are_labelled_with_the_worker(app):
+    client = app.test_client()
+    response = client.get('/api/bays')
+    assert 'sql-execute;dur=' in response.headers['Server-Timing']
+
+    text = client.get('/metrics').get_data(as_text=True)
+    pid = f'pid="{os.getpid()}"'
+    assert f'substation_request_duration_seconds_count{{{pid},method="GET",route="/api/bays"}}' in text
+    assert f'substation_request_sql_execute_seconds_total{{{pid},method="GET",route="/api/bays"}}' in text
+    assert f'substation_ingest_queue_depth{{{pid}}} 0' in text
@@ -0,0 +1,34 @@
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import text
+
+from app import db
+from conftest import MIGRATIONS_DIR
+
+
+def test_line_values_move_onto_the_record(make_app):
+    app = make_app(revision='c4d92e7f1b36')
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text("""
+                INSERT INTO measurement_record (id, timestamp, element_type, substation_name, bay_name,
+                                                voltage_level, relay_type)
+                VALUES (1, '2024-01-01 00:00:00.000000', 'line', 'SS-01', 'LN-1', '132kV', 'distance')
+            """))
+            connection.execute(text("INSERT INTO phase_current (record_id, phase, value) "
+                                    "VALUES (1, 'IA', 410.5), (1, 'IB', 402), (1, 'IN', 8.5)"))
+            connection.execute(text("INSERT INTO phase_voltage (record_id, phase, value) VALUES (1, 'VA', 76.2)"))
+            connection.execute(text("INSERT INTO sequence_component (record_id, component, value) "
+                                    "VALUES (1, 'I0', 3.1)"))
+
+        upgrade(directory=MIGRATIONS_DIR, revision='e7a1f3c95b20')
+        with db.engine.connect() as connection:
+            row = connection.execute(text("SELECT phase_ia, phase_ib, phase_ic, phase_in, phase_va, seq_i0, seq_v0 "
+                                          "FROM measurement_record WHERE id = 1")).one()
+        assert tuple(row) == (410.5, 402.0, None, 8.5, 76.2, 3.1, None)
+
+        downgrade(directory=MIGRATIONS_DIR, revision='c4d92e7f1b36')
+        with db.engine.connect() as connection:
+            currents = connection.execute(text("SELECT phase, value FROM phase_current WHERE record_id = 1")).all()
+            components = connection.execute(text("SELECT component, value FROM sequence_component")).all()
+        assert sorted(currents) == [('IA', 410.5), ('IB', 402.0), ('IN', 8.5)]
+        assert components == [('I0', 3.1)]
@@ -0,0 +1,14 @@
+from datetime import datetime
+
+import pytest
+
+from app import explain_scenario, get_plan_check_scenarios
+
+
+@pytest.mark.parametrize('name', list(get_plan_check_scenarios()))
+def test_report_query_uses_index(app, ingest_fleet, name):
+    ingest_fleet(datetime(2024, 1, 1), days=1)
+    plans = explain_scenario(get_plan_check_scenarios()[name])
+    assert plans
+    for plan, scans in plans:
+        assert not scans, ' | '.join(plan)
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import numpy as np
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import build_fleet, generate_fleet_rows, get_report_cache_key, ingest_measurements
+
+SUMMARY_URL = '/reports/summary?start_date=2024-01-02&end_date=2024-01-02&substation=SS-01'
+
+
+def ingest_day(substation, day):
+    rng = np.random.default_rng(1)
+    rows = [row for row in generate_fleet_rows(build_fleet(substations=2, transformers=1, lines=1, rng=rng),
+                                               day, 4, rng=rng)
+            if row['substation_name'] == substation]
+    _, errors = ingest_measurements(rows)
+    assert not errors
+
+
+def test_matching_etag_is_not_modified(app, ingest_fleet):
+    ingest_fleet(datetime(2024, 1, 1), days=2)
+    client = app.test_client()
+    response = client.get(SUMMARY_URL)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    revalidated = client.get(SUMMARY_URL, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == response.headers['ETag']
+
+
+def test_etag_follows_the_reports_data(app, ingest_fleet):
+    ingest_fleet(datetime(2024, 1, 1), days=3, substations=2)
+    client = app.test_client()
+    etag = client.get(SUMMARY_URL).headers['ETag']
+
+    # Readings outside the report's substation or days leave it unchanged
+    ingest_day('SS-02', datetime(2024, 1, 2, 12))
+    ingest_day('SS-01', datetime(2024, 1, 3, 12))
+    assert client.get(SUMMARY_URL, headers={'If-None-Match': etag}).status_code == 304
+
+    ingest_day('SS-01', datetime(2024, 1, 2, 12))
+    response = client.get(SUMMARY_URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_threshold_report_key_follows_the_limits(app, ingest_fleet):
+    ingest_fleet(datetime(2024, 1, 1), days=1)
+    form_data = ImmutableMultiDict({'start_date': '2024-01-01', 'end_date': '2024-01-01'})
+    key = get_report_cache_key('thresholds', form_data)
+    assert get_report_cache_key('thresholds', form_data) == key
+
+    result = app.test_cli_runner().invoke(args=['set-threshold', 'current', '--substation', 'SS-01', '--high', '900'])
+    assert result.exit_code == 0, result.output
+    changed = get_report_cache_key('thresholds', form_data)
+    assert changed != key
+    assert get_report_cache_key('thresholds', ImmutableMultiDict(dict(form_data, mode='anomalies'))) != changed
@@ -0,0 +1,46 @@
+from app import MeasurementStream, format_stream_event, get_listing_filters, measurement_stream
+
+
+def test_stream_turns_clients_away_when_full(make_app):
+    app = make_app(STREAM_MAX_CLIENTS=1)
+    client = app.test_client()
+    first = client.get('/stream', buffered=False)
+    try:
+        # The stream registers on its first read
+        assert next(first.response).startswith(b'retry:')
+        assert measurement_stream.client_count() == 1
+
+        response = client.get('/stream')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '60'
+        assert response.is_json
+    finally:
+        first.close()
+    assert measurement_stream.client_count() == 0
+    second = client.get('/stream', buffered=False)
+    try:
+        assert second.status_code == 200
+    finally:
+        second.close()
+
+
+def test_stream_past_the_limit_is_told_to_retry():
+    stream = MeasurementStream()
+    first = stream.listen(get_listing_filters({}), max_clients=1)
+    next(first)
+    late = list(stream.listen(get_listing_filters({}), max_clients=1))
+    assert late == [format_stream_event('busy', {'retry_after': 60})]
+    assert stream.client_count() == 1
+    first.close()
+    assert stream.client_count() == 0
+
+
+def test_slow_stream_is_disconnected():
+    stream = MeasurementStream(buffer_size=2)
+    listener = stream.listen(get_listing_filters({}), max_clients=1)
+    next(listener)
+    stream.publish([('SS-01', 'TR-1', f'event {index}') for index in range(3)])
+    # The page reloads the listing on overflow, so the queued events are not sent
+    assert list(listener) == [format_stream_event('overflow', {})]
+    assert stream.client_count() == 0
+
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from app import (TransformerDay, build_fleet, db, find_stale_transformer_days, generate_fleet_rows,
+                 get_report_filters, get_transformer_days, ingest_measurements)
+
+REPORT_URL = '/reports/transformers?start_date=2024-01-01&end_date=2024-01-02'
+
+
+def test_ingest_keeps_transformer_days_current(make_app, ingest_fleet):
+    app = make_app()
+    with app.app_context():
+        # Batches end part way through a day, so a day's first reading looks back into the previous batch
+        ingest_fleet(datetime(2024, 1, 1), days=3, substations=2, batch_size=70)
+        filters = get_report_filters({})
+        ingested = get_transformer_days(filters).sort_values(['substation', 'bay', 'day'], ignore_index=True)
+        assert len(ingested) == 2 * 3
+
+        db.session.execute(TransformerDay.__table__.delete())
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['refresh-transformer-days'])
+    assert 'Refreshed 6 transformer days' in result.output
+
+    with app.app_context():
+        refreshed = get_transformer_days(filters).sort_values(['substation', 'bay', 'day'], ignore_index=True)
+        pd.testing.assert_frame_equal(ingested, refreshed)
+
+
+def test_ingest_refreshes_only_its_transformers(make_app, ingest_fleet):
+    app = make_app()
+    with app.app_context():
+        ingest_fleet(datetime(2024, 1, 1), days=2, substations=2)
+        rng = np.random.default_rng(0)
+        rows = list(generate_fleet_rows(build_fleet(substations=2, transformers=1, lines=1, rng=rng),
+                                        datetime(2024, 1, 3), 96, rng=rng))
+        ingest_measurements([row for row in rows if row['substation_name'] == 'SS-02'])
+        db.session.execute(TransformerDay.__table__.delete().where(TransformerDay.substation_name == 'SS-02',
+                                                                   TransformerDay.bucket_start >= '2024-01-03'))
+        db.session.commit()
+
+        # The other substation's stale day is in the batch's date range but not among its transformers
+        _, errors = ingest_measurements([row for row in rows if row['substation_name'] == 'SS-01'])
+        assert not errors
+        stale = find_stale_transformer_days(get_report_filters({}))
+        assert stale[['substation', 'bay']].values.tolist() == [['SS-02', 'TR-1']]
+        assert f"{stale['day'].iloc[0]:%Y-%m-%d}" == '2024-01-03'
+        assert len(get_transformer_days(get_report_filters({'substation': 'SS-01'}))) == 3
+
+
+def test_transformer_report_is_read_only(make_app, ingest_fleet):
+    app = make_app()
+    with app.app_context():
+        ingest_fleet(datetime(2024, 1, 1), days=2)
+        db.session.execute(TransformerDay.__table__.delete().where(TransformerDay.bucket_start >= '2024-01-02'))
+        db.session.commit()
+
+        writes = []
+        def record_write(conn, cursor, statement, parameters, context, executemany):
+            if not statement.lstrip().upper().startswith('SELECT'):
+                writes.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record_write)
+        try:
+            response = app.test_client().get(REPORT_URL)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record_write)
+
+    assert response.status_code == 200
+    assert b'1 transformer days have readings that are not in this report yet' in response.data
+    assert writes == []
+
+    # Refreshing changes the ETag, so revalidation picks up the completed report
+    app.test_cli_runner().invoke(args=['refresh-transformer-days'])
+    response = app.test_client().get(REPORT_URL, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 200
+    assert b'not in this report yet' not in response.data